@@ -0,0 +1,85 @@
+import hashlib
+import json
+from datetime import date, timedelta
+from flask import current_app
+from sqlalchemy import case, func, select
+from models import db, Product
+from page_cache import data_version
+from stats import EXPIRING_SOON_DAYS
+
+# Months covered by the expiry timeline, starting with the current one
+TIMELINE_MONTHS = 12
+
+
+def _add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def _month_bucket(column):
+    """SQL expression for the 'YYYY-MM' a date falls in"""
+    if db.engine.dialect.name == 'postgresql':
+        return func.to_char(column, 'YYYY-MM')
+    return func.strftime('%Y-%m', column)
+
+
+def expiry_timeline(user_id, today, months=TIMELINE_MONTHS):
+    """Products and value whose warranty ends in each month, as one GROUP BY over the expiry index"""
+    start = today.replace(day=1)
+    end = _add_months(start, months)
+    bucket = _month_bucket(Product.expiry_date).label('month')
+    rows = db.session.execute(
+        select(bucket, func.count(Product.id), func.sum(Product.price))
+        .where(Product.user_id == user_id, Product.expiry_date >= start, Product.expiry_date < end)
+        .group_by(bucket)
+    ).all()
+    found = {month: (count, float(value or 0)) for month, count, value in rows}
+    timeline = []
+    for offset in range(months):
+        month = _add_months(start, offset).strftime('%Y-%m')
+        count, value = found.get(month, (0, 0.0))
+        timeline.append({'month': month, 'expiring': count, 'value_at_risk': round(value, 2)})
+    return timeline
+
+
+def category_breakdown(user_id, today):
+    soon = today + timedelta(days=EXPIRING_SOON_DAYS)
+    rows = db.session.execute(
+        select(
+            Product.category,
+            func.count(Product.id),
+            func.sum(Product.price),
+            func.sum(case((Product.expiry_date >= today, 1), else_=0)),
+            func.sum(case(((Product.expiry_date >= today) & (Product.expiry_date <= soon), 1), else_=0)),
+            func.sum(case((Product.expiry_date >= today, Product.price), else_=0)),
+        ).where(Product.user_id == user_id).group_by(Product.category).order_by(func.sum(Product.price).desc())
+    ).all()
+    return [{
+        'category': category,
+        'products': count,
+        'value': round(float(value or 0), 2),
+        'active': int(active or 0),
+        'expiring_soon': int(expiring or 0),
+        'expired': count - int(active or 0),
+        'covered_value': round(float(covered or 0), 2),
+    } for category, count, value, active, expiring, covered in rows]
+
+
+def user_analytics(user_id, today=None):
+    """Expiry timeline and category breakdown, cached until the user's next write or the next day"""
+    today = today or date.today()
+    cache = current_app.extensions.get('page_cache')
+    key = None
+    if cache is not None:
+        parts = ('analytics', user_id, data_version(user_id), today.isoformat())
+        key = hashlib.sha256('|'.join(str(part) for part in parts).encode()).hexdigest()[:32]
+        cached = cache.get(key)
+        if cached is not None:
+            return json.loads(cached)
+    result = {
+        'timeline': expiry_timeline(user_id, today),
+        'categories': category_breakdown(user_id, today),
+    }
+    if key is not None:
+        cache.set(key, json.dumps(result).encode())
+    return result
@@ -0,0 +1,216 @@
+import hashlib
+import secrets
+from datetime import date, timedelta
+from functools import wraps
+from flask import Blueprint, current_app, g, jsonify, request
+from sqlalchemy import select
+from models import db, ApiToken, Product, User
+from page_cache import data_version
+from pagination import paginate, page_size, SORT_ORDERS, DEFAULT_SORT, DEFAULT_PAGE_SIZE
+from stats import user_stats
+from analytics import user_analytics
+from categories import category_id
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+def _upload_url(path):
+    return f"{request.script_root}/uploads/{path}" if path else None
+
+
+# Field name -> (column, converter applied to non-null values)
+PRODUCT_FIELDS = {
+    'id': (Product.id, None),
+    'name': (Product.name, None),
+    'brand': (Product.brand, None),
+    'category': (Product.category, None),
+    'purchase_date': (Product.purchase_date, date.isoformat),
+    'warranty_duration': (Product.warranty_duration, None),
+    'price': (Product.price, None),
+    'expiry_date': (Product.expiry_date, date.isoformat),
+    'receipt': (Product.receipt, None),
+    'receipt_url': (Product.receipt_path, _upload_url),
+    'image_url': (Product.product_image, _upload_url),
+}
+DEFAULT_FIELDS = ('id', 'name', 'brand', 'category', 'purchase_date', 'warranty_duration', 'price', 'expiry_date',
+                  'receipt')
+
+# ?expiring_within= beyond a century would overflow the date arithmetic
+MAX_EXPIRING_WITHIN_DAYS = 36500
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@api.errorhandler(ApiError)
+def api_error(error):
+    response = jsonify({'error': error.message})
+    response.status_code = error.status
+    if error.status == 401:
+        response.headers['WWW-Authenticate'] = 'Bearer'
+    return response
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def create_token(user_id, name):
+    """Store a new token for a user and return it; only its hash is kept"""
+    token = secrets.token_urlsafe(32)
+    db.session.add(ApiToken(user_id=user_id, name=name, token_hash=hash_token(token)))
+    return token
+
+
+def token_required(view):
+    """Authenticate "Authorization: Bearer <token>" and put the owner's id in g.api_user_id"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not token:
+            raise ApiError('missing bearer token', 401)
+        user_id = db.session.scalar(select(ApiToken.user_id).where(ApiToken.token_hash == hash_token(token.strip())))
+        if user_id is None:
+            raise ApiError('invalid token', 401)
+        g.api_user_id = user_id
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def conditional(view):
+    """Answer with an ETag derived from the user's data version, and 304 when it still matches.
+
+    The version is read before the view runs, so the 304 costs one indexed lookup.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        parts = (g.api_user_id, data_version(g.api_user_id), date.today().isoformat(), request.full_path)
+        etag = hashlib.sha256('|'.join(str(part) for part in parts).encode()).hexdigest()[:32]
+        if request.if_none_match.contains_weak(etag):
+            response = current_app.response_class(status=304)
+        else:
+            response = view(*args, **kwargs)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return wrapper
+
+
+def _fields():
+    requested = request.args.get('fields')
+    if not requested:
+        return DEFAULT_FIELDS
+    names = tuple(dict.fromkeys(name.strip() for name in requested.split(',') if name.strip()))
+    unknown = [name for name in names if name not in PRODUCT_FIELDS]
+    if unknown:
+        raise ApiError(f"unknown fields: {', '.join(unknown)}; available: {', '.join(PRODUCT_FIELDS)}")
+    return names
+
+
+def _date_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ApiError(f'{name} must be a YYYY-MM-DD date')
+
+
+def _serializer(fields):
+    """Turn row tuples into dicts; conversions are resolved once, not per row"""
+    converters = [(index, name, PRODUCT_FIELDS[name][1]) for index, name in enumerate(fields)]
+    plain = all(convert is None for _, _, convert in converters)
+
+    def serialize(row):
+        if plain:
+            return dict(zip(fields, row))
+        return {name: convert(row[index]) if convert and row[index] is not None else row[index]
+                for index, name, convert in converters}
+    return serialize
+
+
+@api.route('/tokens', methods=['POST'])
+def issue_token():
+    """Exchange an email and password for a new API token"""
+    body = request.get_json(silent=True) or {}
+    user = User.query.filter_by(email=body.get('email')).first()
+    if user is None or not user.check_password(body.get('password') or ''):
+        raise ApiError('invalid email or password', 401)
+    token = create_token(user.id, str(body.get('name') or 'api')[:100])
+    db.session.commit()
+    return jsonify({'token': token}), 201
+
+
+@api.route('/products')
+@token_required
+@conditional
+def list_products():
+    """Keyset-paginated products with ?fields=, ?category=, ?expires_after=, ?expires_before=, ?expiring_within="""
+    fields = _fields()
+    sort = request.args.get('sort', DEFAULT_SORT)
+    if sort not in SORT_ORDERS:
+        raise ApiError(f"sort must be one of: {', '.join(SORT_ORDERS)}")
+    # The cursor needs the id and the sort column, even when the client did not ask for them
+    sort_column = SORT_ORDERS[sort][1]
+    selected = list(fields)
+    for name in ('id', sort_column.key if sort_column is not None else None):
+        if name and name not in selected:
+            selected.append(name)
+    query = db.session.query(*[PRODUCT_FIELDS[name][0] for name in selected]).filter(
+        Product.user_id == g.api_user_id)
+
+    category = request.args.get('category')
+    if category:
+        query = query.filter(Product.category_id == (category_id(g.api_user_id, category) or 0))
+    expires_after, expires_before = _date_arg('expires_after'), _date_arg('expires_before')
+    within = request.args.get('expiring_within')
+    if within:
+        if not within.isdigit() or int(within) > MAX_EXPIRING_WITHIN_DAYS:
+            raise ApiError(f'expiring_within must be a number of days up to {MAX_EXPIRING_WITHIN_DAYS}')
+        expires_after = max(expires_after or date.min, date.today())
+        expires_before = min(expires_before or date.max, date.today() + timedelta(days=int(within)))
+    if expires_after:
+        query = query.filter(Product.expiry_date >= expires_after)
+    if expires_before:
+        query = query.filter(Product.expiry_date <= expires_before)
+
+    page = paginate(query, sort=sort, cursor=request.args.get('cursor'),
+                    per_page=page_size(request.args.get('limit', DEFAULT_PAGE_SIZE)))
+    serialize = _serializer(fields)
+    return jsonify({
+        'data': [serialize(row[:len(fields)]) for row in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+    })
+
+
+@api.route('/products/<int:id>')
+@token_required
+@conditional
+def get_product(id):
+    fields = _fields()
+    row = db.session.execute(select(*[PRODUCT_FIELDS[name][0] for name in fields]).where(
+        Product.id == id, Product.user_id == g.api_user_id)).first()
+    if row is None:
+        raise ApiError('not found', 404)
+    return jsonify(_serializer(fields)(row))
+
+
+@api.route('/stats')
+@token_required
+@conditional
+def stats():
+    return jsonify(user_stats(g.api_user_id))
+
+
+@api.route('/analytics')
+@token_required
+@conditional
+def analytics():
+    """Per-month expiry counts and value at risk, and a per-category breakdown"""
+    return jsonify(user_analytics(g.api_user_id))
@@ -1,145 +1,339 @@
-from flask import Flask, render_template, redirect, url_for, flash, request, make_response, send_from_directory
+from flask import Blueprint, Flask, Response, current_app, jsonify, render_template, redirect, url_for, flash, request, send_file, stream_with_context
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from werkzeug.utils import secure_filename
 import os
+import click
+import time
 from datetime import datetime
-from models import db, User, Product
-from forms import RegistrationForm, LoginForm, ProductForm, SettingsForm
+from models import db, User, Product, Job, ApiToken, create_missing_columns, create_missing_indexes
+from forms import RegistrationForm, LoginForm, ProductForm, SettingsForm, ImportForm
 from config import Config
-from seed import seed_db
+from seed import seed_db, generate_synthetic
+from pagination import paginate, page_size, SORT_ORDERS, DEFAULT_SORT, RELEVANCE_SORT, DEFAULT_PAGE_SIZE
+from search import init_search, rebuild_search, apply_search
+from export import export_rows, EXPORT_FORMATS
+from importer import import_products, read_rows
+from thumbnails import generate_thumbnails, delete_thumbnails, responsive_image, thumbnail_savings, THUMBNAIL_WIDTHS
+from storage import save_product_file, detach_all, migrate_file, is_blob, user_owns_file, send_upload, KIND_ATTRIBUTES, BLOB_DIR
+from jobs import enqueue
+from reminders import schedule_reminders, send_notifications
+from user_cache import load_session_user, invalidate_user
+from metrics import init_metrics
+from page_cache import init_page_cache, cached_page
+from api import api, create_token
+from assets import asset_url, build_assets, send_asset, artifact_checksums, ChecksumError
+from compression import init_compression, stream_page
+from replicas import init_replicas
+from db_tuning import init_db_tuning
+from reports import portfolio_report
+from analytics import user_analytics
+from categories import category_id, user_categories, suggestion_etag, cached_suggestions, migrate_categories
+from stats import user_stats, upcoming_products, expired_products, rebuild_all_stats, check_stats
+
+# Routes and CLI commands; cli_group=None keeps the commands at the top level (flask init-db)
+bp = Blueprint('main', __name__, cli_group=None)
 
-app = Flask(__name__)
-app.config.from_object(Config)
-
-db.init_app(app)
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
-
-# Database initialization function
-def init_db():
-    """Initialize database - runs on first app context creation"""
-    with app.app_context():
-        # Create all tables if they don't exist
-        db.create_all()
-        
-        # Only seed if no users exist
-        if User.query.first() is None:
-            seed_db()
-            print("Database initialized and seeded with sample data.")
-        else:
-            print("Database already initialized.")
-
-# Initialize database on app startup (works with both dev and production)
-with app.app_context():
+login_manager.login_view = 'main.login'
+
+# Content-addressed uploads and their thumbnails never change under the same URL
+IMMUTABLE_UPLOAD_PREFIXES = (f'/static/uploads/{BLOB_DIR}/', f'/static/uploads/thumbs/{BLOB_DIR}/')
+
+def create_app(config=Config):
+    """Build the application. Does no database I/O: run `flask init-db` (and `flask seed`) once per deploy"""
+    app = Flask(__name__)
+    app.config.from_object(config)
+    db.init_app(app)
+    init_db_tuning(app)
+    login_manager.init_app(app)
+    app.register_blueprint(bp)
+    app.register_blueprint(api)
+    init_metrics(app)
+    init_replicas(app)
+    init_page_cache(app)
+    init_compression(app)
+    return app
+
+@bp.cli.command('init-db')
+def init_db_command():
+    """Create missing tables, indexes and the search index (safe to re-run)"""
+    db.create_all()
+    create_missing_columns()
+    resolved, updated = migrate_categories()
+    if updated:
+        print(f"Linked {updated} products to {resolved} categories.")
+    create_missing_indexes()
+    init_search()
+    print("Database initialized.")
+
+@bp.cli.command('seed')
+def seed_command():
+    """Add the sample users and products to an empty database"""
+    if User.query.first() is not None:
+        print("Database already has users; not seeding.")
+        return
+    seed_db()
+
+@bp.cli.command('seed-synthetic')
+@click.option('--users', default=100, show_default=True)
+@click.option('--products-per-user', default=50, show_default=True)
+@click.option('--seed', 'random_seed', default=42, show_default=True, help='On the same day and starting database, the same seed generates the same data')
+@click.option('--years', default=6, show_default=True, help='Spread purchase dates over this many years')
+@click.option('--assets/--no-assets', default=True, help='Draw a placeholder image and receipt PDF per product')
+@click.option('--processes', type=int, help='Processes drawing assets (default: one per CPU)')
+@click.option('--batch-size', default=10000, show_default=True, help='Rows per INSERT and transaction')
+def seed_synthetic_command(users, products_per_user, random_seed, years, assets, processes, batch_size):
+    """Generate a production-sized database of synthetic users and products for load testing"""
+    users, products, seconds = generate_synthetic(users, products_per_user, seed=random_seed, assets=assets,
+                                                  processes=processes, batch_size=batch_size, years=years,
+                                                  upload_folder=current_app.config['UPLOAD_FOLDER'])
+    print(f"Created {users} users and {products} products in {seconds:.1f}s ({products / seconds:.0f} products/sec).")
+
+@bp.cli.command('rebuild-stats')
+@click.option('--stale-only', is_flag=True, help='Only rebuild summaries not rolled over to today (for a nightly job)')
+def rebuild_stats_command(stale_only):
+    """Recompute the per-user warranty summaries from the products table"""
+    count = rebuild_all_stats(stale_only=stale_only)
+    print(f"Rebuilt warranty summaries for {count} users.")
+
+@bp.cli.command('check-stats')
+def check_stats_command():
+    """Verify the per-user warranty summaries against the products table"""
+    problems = check_stats()
+    for user_id, field, stored, actual in problems:
+        print(f"user {user_id}: {field} is {stored}, expected {actual}")
+    if problems:
+        raise SystemExit(1)
+    print("Warranty summaries are consistent.")
+
+@bp.cli.command('rebuild-search')
+def rebuild_search_command():
+    """Create the full-text search index if needed and rebuild it from the products table"""
+    init_search()
+    rebuild_search()
+    print("Search index rebuilt.")
+
+@bp.cli.command('import-products')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--email', required=True, help='Owner of the imported products')
+def import_products_command(path, email):
+    """Bulk import products from a CSV or JSON Lines file"""
+    user = User.query.filter_by(email=email).first()
+    if user is None:
+        raise click.ClickException(f"No user with email {email}")
+    with current_app.test_request_context(), open(path, 'rb') as stream:
+        report = import_products(read_rows(stream, import_format(path)), user.id)
+    for number, errors in report.errors:
+        print(f"row {number}: " + '; '.join(f"{field}: {' '.join(messages)}" for field, messages in errors.items()))
+    print(f"Imported {report.imported} products, rejected {report.failed}, "
+          f"in {report.seconds:.1f}s ({report.rows_per_second:.0f} rows/sec).")
+
+@bp.cli.command('build-assets')
+@click.option('--checksums', is_flag=True, help='Only download the pinned artifacts and print their SHA-256')
+def build_assets_command(checksums):
+    """Build the Tailwind CSS and vendor Alpine into fingerprinted, precompressed files"""
+    if checksums:
+        cache_dir = os.path.join(current_app.config['INSTANCE_PATH'], 'asset-cache')
+        for name, digest in artifact_checksums(cache_dir).items():
+            print(f"'{name}': '{digest}',")
+        return
     try:
-        db.create_all()
-        # Check if database needs seeding
-        if User.query.first() is None:
-            seed_db()
-    except Exception as e:
-        print(f"Database initialization error: {e}")
+        manifest = build_assets(current_app)
+    except ChecksumError as e:
+        raise click.ClickException(str(e))
+    for name, hashed in manifest.items():
+        print(f"{name} -> {hashed}")
+
+@bp.cli.command('create-api-token')
+@click.argument('email')
+@click.option('--name', default='cli', show_default=True, help='Label to tell tokens apart')
+def create_api_token_command(email, name):
+    """Issue a JSON API token for a user and print it (it is not stored in clear)"""
+    user = User.query.filter_by(email=email).first()
+    if user is None:
+        raise click.ClickException(f"No user with email {email}")
+    token = create_token(user.id, name)
+    db.session.commit()
+    print(token)
+
+@bp.cli.command('revoke-api-tokens')
+@click.argument('email')
+def revoke_api_tokens_command(email):
+    """Delete every JSON API token of a user"""
+    user = User.query.filter_by(email=email).first()
+    if user is None:
+        raise click.ClickException(f"No user with email {email}")
+    count = ApiToken.query.filter_by(user_id=user.id).delete()
+    db.session.commit()
+    print(f"Revoked {count} tokens.")
+
+@bp.cli.command('generate-thumbnails')
+@click.option('--force', is_flag=True, help='Regenerate thumbnails that already exist')
+def generate_thumbnails_command(force):
+    """Backfill thumbnails for existing product images and report the bytes saved"""
+    filenames = [row[0] for row in db.session.query(Product.product_image).filter(Product.product_image.isnot(None)).distinct()]
+    written = 0
+    for filename in filenames:
+        written += len(generate_thumbnails(current_app.config['UPLOAD_FOLDER'], filename, overwrite=force))
+    print(f"Wrote {written} thumbnails for {len(filenames)} images.")
+    for width in THUMBNAIL_WIDTHS:
+        original_bytes, thumb_bytes = thumbnail_savings(current_app.config['UPLOAD_FOLDER'], filenames, width)
+        if original_bytes:
+            per_page = DEFAULT_PAGE_SIZE / len(filenames)
+            print(f"{width}px: {original_bytes / 1024:.0f} KiB of originals -> {thumb_bytes / 1024:.0f} KiB; "
+                  f"a {DEFAULT_PAGE_SIZE}-card products page saves about {(original_bytes - thumb_bytes) * per_page / 1024:.0f} KiB")
+
+@bp.cli.command('migrate-uploads')
+def migrate_uploads_command():
+    """Move legacy per-user uploads into content-addressed blob storage"""
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    moved = 0
+    legacy = []
+    for product in Product.query.filter((Product.receipt_path.isnot(None)) | (Product.product_image.isnot(None))):
+        for kind in KIND_ATTRIBUTES:
+            old_path = getattr(product, KIND_ATTRIBUTES[kind])
+            if migrate_file(upload_folder, product, kind):
+                moved += 1
+                legacy.append(old_path)
+                if kind == 'image':
+                    generate_thumbnails(upload_folder, product.product_image, overwrite=False)
+    db.session.commit()
+    # Legacy files are removed only after every product points at its blob
+    for old_path in set(legacy):
+        if os.path.exists(os.path.join(upload_folder, old_path)):
+            os.remove(os.path.join(upload_folder, old_path))
+        delete_thumbnails(upload_folder, old_path)
+    print(f"Moved {moved} uploads into blob storage.")
+
+@bp.cli.command('schedule-reminders')
+@click.option('--date', 'today', type=click.DateTime(formats=['%Y-%m-%d']), help='Run as if today were this date')
+def schedule_reminders_command(today):
+    """Queue expiry reminders for products that entered the 30/7/1-day windows (run daily)"""
+    start = time.perf_counter()
+    products, notifications = schedule_reminders(today.date() if today else None)
+    print(f"Queued {notifications} reminders covering {products} products in {time.perf_counter() - start:.2f}s.")
+
+@bp.cli.command('send-notifications')
+def send_notifications_command():
+    """Deliver pending notifications from the outbox"""
+    sent, failed = send_notifications()
+    print(f"Sent {sent} notifications, {failed} failed.")
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return load_session_user(user_id)
+
+@bp.app_template_global('asset_url')
+def asset_url_global(name):
+    return asset_url(name)
+
+@bp.app_template_global('responsive_image')
+def responsive_image_global(filename):
+    return responsive_image(current_app.config['UPLOAD_FOLDER'], filename)
+
+def import_format(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
 
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
+
+def save_uploads(form, product):
+    """Store the form's receipt and image uploads for a product that already has an id"""
+    if form.receipt_file.data and allowed_file(form.receipt_file.data.filename):
+        save_product_file(current_app.config['UPLOAD_FOLDER'], product, 'receipt', form.receipt_file.data)
+    if form.product_image.data and allowed_file(form.product_image.data.filename):
+        save_product_file(current_app.config['UPLOAD_FOLDER'], product, 'image', form.product_image.data)
+        # Resizing runs on the job pool; pages show the original until thumbnails exist
+        enqueue('generate-thumbnails', user_id=product.user_id, upload_folder=current_app.config['UPLOAD_FOLDER'],
+                filename=product.product_image, overwrite=False)
+
+@bp.after_app_request
+def cache_blobs(response):
+    # Blob URLs change whenever their content does, so browsers may keep them forever.
+    # They are receipts and photos, though: private keeps shared proxies and CDNs from storing them
+    if response.status_code == 200 and request.path.startswith(IMMUTABLE_UPLOAD_PREFIXES):
+        response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
 
-@app.route('/')
+@bp.route('/')
 def index():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     return render_template('index.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     form = RegistrationForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
         if user:
             flash('Email already registered.', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         user = User(email=form.email.data)
         user.set_password(form.password.data)
         db.session.add(user)
         db.session.commit()
         flash('Registration successful. Please log in.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     return render_template('register.html', form=form)
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
         if user and user.check_password(form.password.data):
             login_user(user)
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
         flash('Invalid email or password.', 'danger')
     return render_template('login.html', form=form)
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 @login_required
+@cached_page
 def dashboard():
-    products = Product.query.filter_by(user_id=current_user.id).all()
-    total_products = len(products)
     today = datetime.today().date()
-    active_products = len([p for p in products if p.expiry_date and p.expiry_date >= today])
-    expired_products = len([p for p in products if p.expiry_date and p.expiry_date < today])
-    expiring_soon = len([p for p in products if p.expiry_date and (p.expiry_date - today).days <= 30 and p.expiry_date >= today])
-    total_value = sum(p.price for p in products)
-    upcoming = [p for p in products if p.expiry_date and (p.expiry_date - today).days <= 30 and p.expiry_date >= today]
-    expired = [p for p in products if p.expiry_date and p.expiry_date < today]
-    
-    # Calculate average warranty duration
-    warranty_durations = [p.warranty_duration for p in products if p.warranty_duration]
-    avg_warranty_duration = sum(warranty_durations) / len(warranty_durations) if warranty_durations else 0
-    
-    # Calculate most valuable product
-    max_value = max([p.price for p in products]) if products else 0
-    
-    return render_template('dashboard.html', upcoming=upcoming, expired=expired, total_products=total_products, active_products=active_products, expired_products=expired_products, expiring_soon=expiring_soon, total_value=total_value, avg_warranty_duration=avg_warranty_duration, max_value=max_value)
-
-@app.route('/products')
+    stats = user_stats(current_user.id, today)
+    upcoming = upcoming_products(current_user.id, today)
+    expired = expired_products(current_user.id, today)
+    analytics = user_analytics(current_user.id, today)
+    return render_template('dashboard.html', upcoming=upcoming, expired=expired, analytics=analytics, **stats)
+
+@bp.route('/products')
 @login_required
+@cached_page
 def products():
     query = request.args.get('q', '')
     category_filter = request.args.get('category', '')
+    sort = request.args.get('sort') or (RELEVANCE_SORT if query else DEFAULT_SORT)
+    per_page = page_size(request.args.get('per_page', DEFAULT_PAGE_SIZE))
     base_query = Product.query.filter_by(user_id=current_user.id)
+    rank = None
 
     if query:
-        base_query = base_query.filter(
-            (Product.name.contains(query) | Product.brand.contains(query) | Product.category.contains(query))
-        )
+        base_query, rank = apply_search(base_query, query, current_user.id)
 
     if category_filter:
-        base_query = base_query.filter(Product.category == category_filter)
+        # An unknown name matches nothing rather than the products without a category id
+        base_query = base_query.filter(Product.category_id == (category_id(current_user.id, category_filter) or 0))
 
-    products = base_query.all()
-    # Get existing categories for filter dropdown
-    existing_categories = db.session.query(Product.category).filter_by(user_id=current_user.id).distinct().all()
-    categories = [cat[0] for cat in existing_categories]
-    return render_template('products.html', products=products, query=query, category_filter=category_filter, categories=categories, datetime=datetime)
+    page = paginate(base_query, sort=sort, cursor=request.args.get('cursor'), per_page=per_page, rank=rank)
+    categories = user_categories(current_user.id)
+    return stream_page('products.html', products=page.items, page=page, sort_orders=SORT_ORDERS, relevance_sort=RELEVANCE_SORT if rank is not None else None, query=query, category_filter=category_filter, categories=categories, today=datetime.today().date())
 
-@app.route('/add_product', methods=['GET', 'POST'])
+@bp.route('/add_product', methods=['GET', 'POST'])
 @login_required
 def add_product():
     form = ProductForm()
-    # Get existing categories for suggestions
-    existing_categories = db.session.query(Product.category).filter_by(user_id=current_user.id).distinct().all()
-    categories = [cat[0] for cat in existing_categories]
     if form.validate_on_submit():
         product = Product(
             name=form.name.data,
@@ -152,53 +346,27 @@ def add_product():
             user_id=current_user.id
         )
         product.calculate_expiry()
-        if form.receipt_file.data:
-            file = form.receipt_file.data
-            if allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{current_user.id}_receipt_{filename}")
-                file.save(file_path)
-                product.receipt_path = f"{current_user.id}_receipt_{filename}"
-        if form.product_image.data:
-            file = form.product_image.data
-            if allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{current_user.id}_image_{filename}")
-                file.save(file_path)
-                product.product_image = f"{current_user.id}_image_{filename}"
         db.session.add(product)
+        # Uploads are linked by product id, so the row needs one first
+        db.session.flush()
+        save_uploads(form, product)
         db.session.commit()
         flash('Product added successfully.', 'success')
-        return redirect(url_for('dashboard'))
-    return render_template('add_product.html', form=form, categories=categories)
+        return redirect(url_for('main.dashboard'))
+    # Category suggestions are fetched as the user types, from category_suggestions()
+    return render_template('add_product.html', form=form)
 
-@app.route('/edit_product/<int:id>', methods=['GET', 'POST'])
+@bp.route('/edit_product/<int:id>', methods=['GET', 'POST'])
 @login_required
 def edit_product(id):
     product = Product.query.get_or_404(id)
     if product.user_id != current_user.id:
         flash('Access denied.', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     form = ProductForm(obj=product)
-    # Get existing categories for suggestions
-    existing_categories = db.session.query(Product.category).filter_by(user_id=current_user.id).distinct().all()
-    categories = [cat[0] for cat in existing_categories]
     if form.validate_on_submit():
         # Handle file uploads first
-        if form.receipt_file.data:
-            file = form.receipt_file.data
-            if allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{current_user.id}_receipt_{filename}")
-                file.save(file_path)
-                product.receipt_path = f"{current_user.id}_receipt_{filename}"
-        if form.product_image.data:
-            file = form.product_image.data
-            if allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{current_user.id}_image_{filename}")
-                file.save(file_path)
-                product.product_image = f"{current_user.id}_image_{filename}"
+        save_uploads(form, product)
         
         # Update other fields
         product.name = form.name.data
@@ -212,66 +380,74 @@ def edit_product(id):
         product.calculate_expiry()
         db.session.commit()
         flash('Product updated successfully.', 'success')
-        return redirect(url_for('dashboard'))
-    return render_template('edit_product.html', form=form, product=product, categories=categories)
+        return redirect(url_for('main.dashboard'))
+    # Category suggestions are fetched as the user types, as on add_product
+    return render_template('edit_product.html', form=form, product=product)
 
-@app.route('/delete_product/<int:id>', methods=['POST'])
+@bp.route('/delete_product/<int:id>', methods=['POST'])
 @login_required
 def delete_product(id):
     product = Product.query.get_or_404(id)
     if product.user_id != current_user.id:
         flash('Access denied.', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
-    # Delete associated files
-    if product.receipt_path:
+    # Shared blobs are released and only unlinked once nothing references them
+    detach_all(current_app.config['UPLOAD_FOLDER'], product)
+
+    # Delete files uploaded before content-addressed storage
+    if product.receipt_path and not is_blob(product.receipt_path):
         receipt_path = os.path.join('static', 'uploads', product.receipt_path)
         if os.path.exists(receipt_path):
             os.remove(receipt_path)
 
-    if product.product_image:
+    if product.product_image and not is_blob(product.product_image):
         image_path = os.path.join('static', 'uploads', product.product_image)
         if os.path.exists(image_path):
             os.remove(image_path)
+        delete_thumbnails(current_app.config['UPLOAD_FOLDER'], product.product_image)
 
     db.session.delete(product)
     db.session.commit()
     flash('Product deleted successfully.', 'success')
-    return redirect(url_for('dashboard'))
+    return redirect(url_for('main.dashboard'))
 
-@app.route('/search')
+@bp.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_view():
+    form = ImportForm()
+    report = None
+    if form.validate_on_submit():
+        file = form.file.data
+        report = import_products(read_rows(file.stream, import_format(file.filename)), current_user.id)
+        flash(f'Imported {report.imported} products.', 'success' if not report.failed else 'warning')
+    return render_template('import_products.html', form=form, report=report)
+
+@bp.route('/search')
 @login_required
 def search():
     query = request.args.get('q', '')
-    return redirect(url_for('products', q=query))
+    return redirect(url_for('main.products', q=query))
 
-@app.route('/export_csv')
+@bp.route('/export_csv')
+@bp.route('/export/<fmt>')
 @login_required
-def export_csv():
-    import csv
-    from io import StringIO
-    products = Product.query.filter_by(user_id=current_user.id).all()
-    si = StringIO()
-    writer = csv.writer(si)
-    writer.writerow(['Name', 'Brand', 'Category', 'Purchase Date', 'Warranty Duration', 'Price', 'Expiry Date'])
-    for product in products:
-        writer.writerow([
-            product.name,
-            product.brand,
-            product.category,
-            product.purchase_date.strftime('%Y-%m-%d'),
-            product.warranty_duration,
-            product.price,
-            product.expiry_date.strftime('%Y-%m-%d')
-        ])
-    output = si.getvalue()
-    si.close()
-    response = make_response(output)
-    response.headers['Content-Disposition'] = 'attachment; filename=products.csv'
-    response.headers['Content-type'] = 'text/csv'
+def export_csv(fmt='csv'):
+    if fmt not in EXPORT_FORMATS:
+        flash('Unsupported export format.', 'danger')
+        return redirect(url_for('main.products'))
+    extension, mimetype = EXPORT_FORMATS[fmt]
+    gzip = request.args.get('gzip') == '1'
+    filename = f"products.{extension}"
+    if gzip:
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    # Rows are fetched in batches and encoded as they are sent, so memory stays flat
+    response = Response(stream_with_context(export_rows(current_user.id, fmt, gzip)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
     return response
 
-@app.route('/settings', methods=['GET', 'POST'])
+@bp.route('/settings', methods=['GET', 'POST'])
 @login_required
 def settings():
     form = SettingsForm()
@@ -279,49 +455,94 @@ def settings():
         # Check current password
         if not current_user.check_password(form.current_password.data):
             flash('Current password is incorrect.', 'danger')
-            return redirect(url_for('settings'))
+            return redirect(url_for('main.settings'))
+
+        # current_user is a cached copy; changes go through the session's instance
+        user = db.session.get(User, current_user.id)
 
         # Update email if changed
-        if form.email.data != current_user.email:
+        if form.email.data != user.email:
             # Check if email is already taken
             existing_user = User.query.filter_by(email=form.email.data).first()
-            if existing_user and existing_user.id != current_user.id:
+            if existing_user and existing_user.id != user.id:
                 flash('Email address is already in use.', 'danger')
-                return redirect(url_for('settings'))
-            current_user.email = form.email.data
+                return redirect(url_for('main.settings'))
+            user.email = form.email.data
 
         # Update password if provided
         if form.new_password.data:
-            current_user.set_password(form.new_password.data)
+            user.set_password(form.new_password.data)
 
         db.session.commit()
+        invalidate_user(user.id)
+        if form.new_password.data:
+            # Other sessions still carry the old session version; keep this one
+            login_user(user)
         flash('Settings updated successfully.', 'success')
-        return redirect(url_for('settings'))
+        return redirect(url_for('main.settings'))
 
     # Pre-populate form with current data
     form.email.data = current_user.email
 
     # Calculate account statistics
-    total_products = Product.query.filter_by(user_id=current_user.id).count()
+    total_products = user_stats(current_user.id)['total_products']
     account_age_days = (datetime.utcnow() - current_user.created_at).days if current_user.created_at else 0
 
     return render_template('settings.html', form=form, total_products=total_products, account_age_days=account_age_days)
 
-@app.route('/uploads/<filename>')
+@bp.route('/reports/portfolio')
+@login_required
+def portfolio_report_view():
+    path, job = portfolio_report(current_user.id)
+    if path is None:
+        # Built by the job workers; the page polls the job and reloads when it is done
+        return render_template('report_pending.html', job=job), 202
+    response = send_file(path, mimetype='application/pdf', as_attachment=True,
+                         download_name='warranty-portfolio.pdf', conditional=True, max_age=0)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@bp.route('/jobs/<int:id>')
+@login_required
+def job_status(id):
+    job = db.session.get(Job, id)
+    if job is None or job.user_id != current_user.id:
+        return jsonify({'error': 'not found'}), 404
+    return jsonify({'id': job.id, 'kind': job.kind, 'status': job.status, 'attempts': job.attempts,
+                    'error': job.error if job.status == 'failed' else None})
+
+@bp.route('/api/categories')
+@login_required
+def category_suggestions():
+    """Up to 10 of the user's category names starting with ?prefix=, for the product form"""
+    prefix = request.args.get('prefix', '').strip()[:50]
+    etag = suggestion_etag(current_user.id, prefix)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(cached_suggestions(current_user.id, prefix, etag))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@bp.route('/static/dist/<path:filename>')
+def static_asset(filename):
+    return send_asset(filename)
+
+@bp.route('/uploads/<path:filename>')
 @login_required
 def uploaded_file(filename):
     # Check if the file belongs to the current user
-    product = Product.query.filter(
-        (Product.receipt_path == filename) | (Product.product_image == filename),
-        Product.user_id == current_user.id
-    ).first()
-
-    if not product:
+    if not user_owns_file(current_user.id, filename):
         flash('File not found or access denied.', 'danger')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
 
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    return send_upload(current_app.config['UPLOAD_FOLDER'], filename, current_app.config['UPLOADS_ACCEL_REDIRECT'])
 
 if __name__ == '__main__':
     # Run Flask development server
+    app = create_app()
+    if 'JOBS_EXECUTOR' not in os.environ:
+        # No worker.py in development: run jobs on the server's own thread pool
+        app.config['JOBS_EXECUTOR'] = 'thread'
     app.run(debug=True)
\ No newline at end of file
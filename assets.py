@@ -0,0 +1,182 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import platform
+import shutil
+import stat
+import subprocess
+import urllib.request
+from flask import current_app, request, send_from_directory
+
+# Pinned third-party assets, downloaded once into ASSET_CACHE and then self-hosted
+TAILWIND_VERSION = '3.4.17'
+ALPINE_VERSION = '3.14.1'
+ALPINE_URL = f'https://unpkg.com/alpinejs@{ALPINE_VERSION}/dist/cdn.min.js'
+
+# SHA-256 of every downloaded artifact, by cache file name. A download is never executed or
+# served unless it matches. When bumping a version, run `flask build-assets --checksums`,
+# compare each digest with the upstream release (Tailwind publishes sha256sums.txt) and add it.
+# Until every artifact is pinned, build-assets stops and pages use the CDN tags in base.html;
+# add build-assets to render.yaml's buildCommand only once it passes
+ARTIFACT_SHA256 = {
+}
+
+# Fingerprinted bundle served from /static/dist/, described by its manifest
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+
+# Only text assets are worth precompressing
+COMPRESSIBLE = ('.css', '.js')
+
+
+def _tailwind_platform():
+    system = {'Linux': 'linux', 'Darwin': 'macos', 'Windows': 'windows'}[platform.system()]
+    arch = 'arm64' if platform.machine().lower() in ('arm64', 'aarch64') else 'x64'
+    return f"{system}-{arch}{'.exe' if system == 'windows' else ''}"
+
+
+class ChecksumError(Exception):
+    pass
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _download(url, path):
+    if not os.path.exists(path):
+        print(f"Downloading {url}")
+        with urllib.request.urlopen(url, timeout=60) as response, open(path + '.part', 'wb') as f:
+            shutil.copyfileobj(response, f)
+        os.replace(path + '.part', path)
+    return path
+
+
+def _verified(path):
+    """Return path if the file matches its pinned SHA-256, else raise ChecksumError"""
+    name = os.path.basename(path)
+    expected = ARTIFACT_SHA256.get(name)
+    actual = _sha256(path)
+    if expected is None:
+        raise ChecksumError(f"{name} has no pinned SHA-256 (got {actual}); verify it upstream and add it "
+                            f"to ARTIFACT_SHA256 in assets.py")
+    if actual != expected:
+        # Drop it so the next build downloads it again rather than failing on the same file
+        os.remove(path)
+        raise ChecksumError(f"{name} has SHA-256 {actual}, expected {expected}; refusing to use it")
+    return path
+
+
+def _artifacts(cache_dir):
+    """(url, cache path) of each pinned download"""
+    return [
+        (f"https://github.com/tailwindlabs/tailwindcss/releases/download/v{TAILWIND_VERSION}/"
+         f"tailwindcss-{_tailwind_platform()}",
+         os.path.join(cache_dir, f"tailwindcss-{TAILWIND_VERSION}-{_tailwind_platform()}")),
+        (ALPINE_URL, os.path.join(cache_dir, f"alpine-{ALPINE_VERSION}.js")),
+    ]
+
+
+def artifact_checksums(cache_dir):
+    """Download the pinned artifacts without using them; return {cache file name: SHA-256}"""
+    os.makedirs(cache_dir, exist_ok=True)
+    return {os.path.basename(path): _sha256(_download(url, path)) for url, path in _artifacts(cache_dir)}
+
+
+def tailwind_binary(cache_dir):
+    """The Tailwind standalone CLI: TAILWIND_BIN, one on PATH, or the pinned release downloaded once"""
+    configured = os.environ.get('TAILWIND_BIN') or shutil.which('tailwindcss')
+    if configured:
+        return configured
+    path = _verified(_download(*_artifacts(cache_dir)[0]))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return path
+
+
+def _fingerprint(source, dist_dir, name):
+    """Copy a file to dist as <stem>.<hash>.<ext> with .gz/.br siblings; return the new name"""
+    with open(source, 'rb') as f:
+        data = f.read()
+    stem, ext = os.path.splitext(name)
+    hashed = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+    target = os.path.join(dist_dir, hashed)
+    with open(target, 'wb') as f:
+        f.write(data)
+    if ext in COMPRESSIBLE:
+        with open(target + '.gz', 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        try:
+            import brotli
+        except ImportError:
+            print("brotli is not installed; skipping .br variants")
+        else:
+            with open(target + '.br', 'wb') as f:
+                f.write(brotli.compress(data, quality=11))
+    return hashed
+
+
+def build_assets(app):
+    """Build the CSS for the classes the templates use, vendor Alpine, fingerprint both.
+
+    Returns the manifest of logical name -> fingerprinted file name.
+    """
+    root = app.root_path
+    cache_dir = os.path.join(app.config['INSTANCE_PATH'], 'asset-cache')
+    dist_dir = os.path.join(app.static_folder, DIST_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+    os.makedirs(dist_dir, exist_ok=True)
+
+    css = os.path.join(cache_dir, 'app.css')
+    subprocess.run([tailwind_binary(cache_dir), '--config', os.path.join(root, 'tailwind.config.js'),
+                    '--input', os.path.join(app.static_folder, 'src', 'app.css'), '--output', css, '--minify'],
+                   cwd=root, check=True)
+    alpine = _verified(_download(*_artifacts(cache_dir)[1]))
+
+    manifest = {
+        'app.css': _fingerprint(css, dist_dir, 'app.css'),
+        'alpine.js': _fingerprint(alpine, dist_dir, 'alpine.js'),
+    }
+    # Old bundles are kept so pages rendered before a deploy can still load theirs
+    with open(os.path.join(dist_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_manifest(app):
+    try:
+        with open(os.path.join(app.static_folder, DIST_DIR, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def asset_url(name):
+    """URL of a built asset, or None until `flask build-assets` has run"""
+    manifest = current_app.extensions.get('asset_manifest')
+    if manifest is None:
+        manifest = current_app.extensions['asset_manifest'] = load_manifest(current_app)
+    hashed = manifest.get(name)
+    return f"{current_app.static_url_path}/{DIST_DIR}/{hashed}" if hashed else None
+
+
+def send_asset(filename):
+    """Serve a fingerprinted asset, precompressed when the client accepts it, cached forever"""
+    dist_dir = os.path.join(current_app.static_folder, DIST_DIR)
+    mimetype = mimetypes.guess_type(filename)[0]
+    response = None
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] and os.path.exists(os.path.join(dist_dir, filename + suffix)):
+            response = send_from_directory(dist_dir, filename + suffix, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            break
+    if response is None:
+        response = send_from_directory(dist_dir, filename, mimetype=mimetype)
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
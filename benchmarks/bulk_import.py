@@ -0,0 +1,76 @@
+"""
+Benchmark the bulk importer on a generated file
+Run this with: python benchmarks/bulk_import.py [--rows 100000] [--format csv|jsonl]
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from models import db, User, Product
+from importer import import_products, read_rows
+
+
+def write_file(path, rows, fmt, rng):
+    fields = ['name', 'brand', 'category', 'purchase_date', 'warranty_duration', 'price', 'receipt']
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fields) if fmt == 'csv' else None
+        if writer:
+            writer.writeheader()
+        for i in range(rows):
+            row = {
+                'name': f'Product {i}',
+                'brand': rng.choice(['Apple', 'Samsung', 'Sony', 'Bosch']),
+                'category': rng.choice(['Electronics', 'Furniture', 'Kitchen Appliances']),
+                'purchase_date': (date(2020, 1, 1) + timedelta(days=rng.randint(0, 2000))).isoformat(),
+                # Roughly 1% of rows are invalid, to exercise the error report
+                'warranty_duration': rng.choice([6, 12, 24, 36]) if rng.random() > 0.01 else 0,
+                'price': round(rng.uniform(100, 100000), 2),
+                'receipt': f'INV-{i}',
+            }
+            if writer:
+                writer.writerow(row)
+            else:
+                f.write(json.dumps(row) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, f'import.{args.format}')
+    write_file(path, args.rows, args.format, random.Random(42))
+
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'benchmark'
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url or f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    db.init_app(app)
+
+    with app.test_request_context():
+        db.drop_all()
+        db.create_all()
+        user = User(email='bench@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        with open(path, 'rb') as stream:
+            report = import_products(read_rows(stream, args.format), user.id)
+        assert Product.query.filter_by(user_id=user.id).count() == report.imported
+        print(f'{args.rows} rows: imported {report.imported}, rejected {report.failed} '
+              f'in {report.seconds:.1f}s ({report.rows_per_second:.0f} rows/sec)')
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
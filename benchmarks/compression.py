@@ -0,0 +1,129 @@
+"""
+Bytes on the wire and time to first byte for the products page of a 5k-product account,
+as sent before (buffered, uncompressed) and after (streamed, minified, compressed)
+Run this with: python benchmarks/compression.py [--products 5000] [--per-page 100] [--requests 20]
+"""
+
+import argparse
+import http.client
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+from app import create_app
+from config import Config
+from models import db, User
+from seed import generate_synthetic
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args):
+        pass
+
+
+class Buffered:
+    """Collect the whole body before sending anything, as a render_template view does"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.enabled = False
+
+    def __call__(self, environ, start_response):
+        body = self.wsgi_app(environ, start_response)
+        if not self.enabled:
+            return body
+        try:
+            return [b''.join(body)]
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+
+
+def login_cookie(port, email):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('POST', '/login', urllib.parse.urlencode({'email': email, 'password': 'password'}),
+                 {'Content-Type': 'application/x-www-form-urlencoded'})
+    response = conn.getresponse()
+    response.read()
+    return response.getheader('Set-Cookie').split(';')[0]
+
+
+def fetch(port, path, cookie, accept_encoding):
+    """Return (ms to first body byte, ms to last byte, bytes received)"""
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    start = time.perf_counter()
+    conn.request('GET', path, headers={'Cookie': cookie, 'Accept-Encoding': accept_encoding})
+    response = conn.getresponse()
+    first = response.read(1)
+    ttfb = time.perf_counter() - start
+    size = len(first) + len(response.read())
+    total = time.perf_counter() - start
+    conn.close()
+    return ttfb * 1000, total * 1000, size
+
+
+def measure(port, path, cookie, accept_encoding, requests):
+    results = [fetch(port, path, cookie, accept_encoding) for _ in range(requests)]
+    return (statistics.median(r[0] for r in results), statistics.median(r[1] for r in results), results[-1][2])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--per-page', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=20)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+        UPLOAD_FOLDER = os.path.join(tmpdir, 'uploads')
+        WTF_CSRF_ENABLED = False
+        JOBS_EXECUTOR = 'worker'
+        PAGE_CACHE = 'none'  # measure rendering, not cache hits
+    os.makedirs(BenchmarkConfig.UPLOAD_FOLDER, exist_ok=True)
+
+    app = create_app(BenchmarkConfig)
+    with app.app_context():
+        db.create_all()
+        generate_synthetic(1, args.products, assets=False)
+        email = User.query.first().email
+
+    buffered = app.wsgi_app = Buffered(app.wsgi_app)
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+    cookie = login_cookie(port, email)
+    path = f'/products?per_page={args.per_page}'
+
+    print(f'{args.products} products, {path}, median of {args.requests} requests')
+    print(f"{'response':32} {'bytes':>9} {'TTFB ms':>8} {'total ms':>9}")
+    cases = [('before: buffered, identity', {'COMPRESS_RESPONSES': False}, 'identity', False)]
+    cases.append(('minified, identity', {'COMPRESS_RESPONSES': True, 'MINIFY_HTML': True}, 'identity', True))
+    cases.append(('after: streamed, minified, gzip', {'COMPRESS_RESPONSES': True, 'MINIFY_HTML': True}, 'gzip', True))
+    try:
+        import brotli  # noqa: F401
+        cases.append(('after: streamed, minified, br', {'COMPRESS_RESPONSES': True}, 'br, gzip', True))
+    except ImportError:
+        print('(brotli not installed; skipping br)')
+    baseline = None
+    for label, config, accept, streamed in cases:
+        app.config.update(config)
+        buffered.enabled = not streamed
+        ttfb, total, size = measure(port, path, cookie, accept, args.requests)
+        baseline = baseline or size
+        print(f'{label:32} {size:9d} {ttfb:8.1f} {total:9.1f}   {size / baseline:6.1%} of the bytes')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark dashboard statistics: aggregate SQL vs loading every Product
+Run this with: python benchmarks/dashboard_stats.py [--sizes 100,1000,10000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from models import db, User, Product
+from stats import dashboard_stats, upcoming_products, expired_products
+
+
+def legacy_dashboard(user_id, today):
+    """The original implementation: hydrate every row and walk the list in Python"""
+    products = Product.query.filter_by(user_id=user_id).all()
+    active = len([p for p in products if p.expiry_date >= today])
+    expired = [p for p in products if p.expiry_date < today]
+    upcoming = [p for p in products if (p.expiry_date - today).days <= 30 and p.expiry_date >= today]
+    durations = [p.warranty_duration for p in products if p.warranty_duration]
+    return {
+        'total_products': len(products),
+        'active_products': active,
+        'expired_products': len(expired),
+        'expiring_soon': len(upcoming),
+        'total_value': sum(p.price for p in products),
+        'max_value': max([p.price for p in products]) if products else 0,
+        'avg_warranty_duration': sum(durations) / len(durations) if durations else 0,
+    }
+
+
+def sql_dashboard(user_id, today):
+    stats = dashboard_stats(user_id, today)
+    upcoming_products(user_id, today)
+    expired_products(user_id, today)
+    return stats
+
+
+def populate(user_id, count, rng):
+    rows = []
+    for i in range(count):
+        purchase = date(2020, 1, 1) + timedelta(days=rng.randint(0, 2500))
+        months = rng.choice([0, 6, 12, 24, 36, 60])
+        rows.append({
+            'name': f'Product {i}',
+            'brand': 'Brand',
+            'category': rng.choice(['Electronics', 'Furniture', 'Books']),
+            'purchase_date': purchase,
+            'warranty_duration': months,
+            'price': round(rng.uniform(100, 100000), 2),
+            'expiry_date': purchase + timedelta(days=months * 30),
+            'user_id': user_id,
+        })
+    db.session.execute(Product.__table__.insert(), rows)
+    db.session.commit()
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='100,1000,10000,50000')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url or f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    db.init_app(app)
+
+    rng = random.Random(42)
+    today = date.today()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        print(f"{'products':>10} {'legacy ms':>12} {'sql ms':>10}")
+        for n, size in enumerate(int(s) for s in args.sizes.split(',')):
+            user = User(email=f'bench{n}@example.com', password_hash='x')
+            db.session.add(user)
+            db.session.commit()
+            populate(user.id, size, rng)
+
+            legacy_ms, expected = timed(lambda: legacy_dashboard(user.id, today), args.repeat)
+            db.session.expunge_all()
+            sql_ms, actual = timed(lambda: sql_dashboard(user.id, today), args.repeat)
+            for key, value in expected.items():
+                assert abs(actual[key] - value) < 0.01, (key, actual[key], value)
+            print(f'{size:>10} {legacy_ms:>12.2f} {sql_ms:>10.2f}')
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
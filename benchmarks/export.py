@@ -0,0 +1,79 @@
+"""
+Benchmark the streaming export: peak Python memory and time-to-first-chunk per format
+Run this with: python benchmarks/export.py [--sizes 10000,100000,500000]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from models import db, User, Product
+from export import export_rows
+
+
+def populate(user_id, count, batch=20000):
+    for start in range(0, count, batch):
+        db.session.execute(Product.__table__.insert(), [{
+            'name': f'Product {i}',
+            'brand': 'Brand',
+            'category': 'Electronics',
+            'purchase_date': date(2024, 1, 1),
+            'warranty_duration': 12,
+            'price': 999.99,
+            'expiry_date': date(2024, 1, 1) + timedelta(days=360),
+            'user_id': user_id,
+        } for i in range(start, min(start + batch, count))])
+        db.session.commit()
+
+
+def measure(user_id, fmt, gzip):
+    tracemalloc.start()
+    start = time.perf_counter()
+    first_chunk = None
+    total = 0
+    for chunk in export_rows(user_id, fmt, gzip):
+        if first_chunk is None:
+            first_chunk = time.perf_counter() - start
+        total += len(chunk)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return first_chunk * 1000, elapsed, peak / 1024 / 1024, total / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='10000,100000,500000')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url or \
+        f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    db.init_app(app)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        print(f"{'rows':>8} {'format':>9} {'first ms':>9} {'total s':>8} {'peak MiB':>9} {'output MiB':>11}")
+        for n, size in enumerate(int(s) for s in args.sizes.split(',')):
+            user = User(email=f'bench{n}@example.com', password_hash='x')
+            db.session.add(user)
+            db.session.commit()
+            populate(user.id, size)
+            for fmt, gzip in [('csv', False), ('csv', True), ('tsv', False), ('jsonl', False)]:
+                first, elapsed, peak, output = measure(user.id, fmt, gzip)
+                label = fmt + ('.gz' if gzip else '')
+                print(f'{size:>8} {label:>9} {first:>9.1f} {elapsed:>8.2f} {peak:>9.2f} {output:>11.1f}')
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
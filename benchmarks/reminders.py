@@ -0,0 +1,71 @@
+"""
+Benchmark the expiry-reminder scheduler against a large products table
+Run this with: python benchmarks/reminders.py [--products 1000000] [--users 10000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import insert
+from models import db, User, Product, Notification, create_missing_indexes
+from reminders import schedule_reminders
+
+CHUNK = 50000
+
+
+def populate(products, users, today, rng):
+    db.session.execute(insert(User), [{'email': f'user{i}@example.com', 'password_hash': 'x'} for i in range(users)])
+    for start in range(0, products, CHUNK):
+        rows = []
+        for i in range(start, min(start + CHUNK, products)):
+            expiry = today + timedelta(days=rng.randint(-1800, 1800))
+            rows.append({'name': f'Product {i}', 'brand': 'Brand', 'category': 'Category',
+                         'purchase_date': expiry - timedelta(days=360), 'warranty_duration': 12,
+                         'price': 100.0, 'expiry_date': expiry, 'user_id': rng.randint(1, users)})
+        db.session.execute(insert(Product), rows)
+    db.session.commit()
+
+
+def timed(label, today):
+    start = time.perf_counter()
+    products, notifications = schedule_reminders(today)
+    print(f'{label:34} {products:7} products -> {notifications:6} notifications in {time.perf_counter() - start:6.3f}s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--products', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=10000)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'benchmark'
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    app.config['JOBS_EXECUTOR'] = 'worker'  # time the scheduler only, not delivery
+    db.init_app(app)
+
+    today = date(2026, 1, 1)
+    with app.app_context():
+        db.create_all()
+        create_missing_indexes()
+        start = time.perf_counter()
+        populate(args.products, args.users, today, random.Random(42))
+        print(f'Inserted {args.products} products in {time.perf_counter() - start:.1f}s')
+        timed('first run (no watermark)', today)
+        timed('next day', today + timedelta(days=1))
+        timed('same day again', today + timedelta(days=1))
+        timed('after a week of downtime', today + timedelta(days=8))
+        print(f'{Notification.query.count()} notifications in the outbox')
+
+
+if __name__ == '__main__':
+    main()
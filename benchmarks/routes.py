@@ -0,0 +1,212 @@
+"""
+Drive the main routes with concurrent logged-in clients over HTTP and report
+throughput, p50/p95/p99 latency and SQL queries per request
+Run this with: python benchmarks/routes.py [--users 200] [--products-per-user 500] [--concurrency 8]
+    --save baseline.json      write the results as a baseline
+    --compare baseline.json   exit 1 if a route regressed past --threshold
+    --database-url URL        use (and fill, if empty) another database, e.g. PostgreSQL
+    --page-cache memory       time cached pages instead of the views (default: none)
+"""
+
+import argparse
+import http.cookiejar
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from werkzeug.datastructures import FileStorage
+from werkzeug.serving import WSGIRequestHandler, make_server
+from app import create_app
+from config import Config
+from models import db, User, Product, create_missing_indexes
+from search import init_search
+from seed import generate_synthetic
+from storage import save_product_file
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args):
+        pass
+
+
+def build_config(args, tmpdir):
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = args.database_url or f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+        UPLOAD_FOLDER = os.path.join(tmpdir, 'uploads')
+        WTF_CSRF_ENABLED = False
+        JOBS_EXECUTOR = 'worker'
+        # With a page cache every request after the first is a cache hit and hides the views' cost
+        PAGE_CACHE = args.page_cache
+    os.makedirs(BenchmarkConfig.UPLOAD_FOLDER, exist_ok=True)
+    return BenchmarkConfig
+
+
+def prepare(app, args):
+    """Generate the dataset unless the database already has one; return (email, routes)"""
+    with app.app_context():
+        db.create_all()
+        create_missing_indexes()
+        init_search()
+        if User.query.filter(User.email.like('load%@example.com')).first() is None:
+            users, products, seconds = generate_synthetic(args.users, args.products_per_user, assets=False)
+            print(f'Generated {users} users / {products} products in {seconds:.0f}s')
+        user = User.query.filter(User.email.like('load%@example.com')).order_by(User.id).first()
+        product = Product.query.filter_by(user_id=user.id).order_by(Product.id).first()
+        upload_folder = app.config['UPLOAD_FOLDER']
+        if not product.product_image or not os.path.exists(os.path.join(upload_folder, product.product_image)):
+            image = FileStorage(io.BytesIO(os.urandom(150 * 1024)), 'benchmark.png')
+            save_product_file(upload_folder, product, 'image', image)
+            db.session.commit()
+        routes = {
+            'dashboard': '/dashboard',
+            'products': '/products',
+            'products_search': '/products?q=' + urllib.parse.quote(product.brand),
+            'export_csv': '/export_csv',
+            'uploads': '/uploads/' + product.product_image,
+        }
+        return user.email, routes
+
+
+def login(base_url, email):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    data = urllib.parse.urlencode({'email': email, 'password': 'password'}).encode()
+    with opener.open(base_url + '/login', data) as response:
+        if response.url.rstrip('/').endswith('/login'):
+            raise SystemExit(f'Could not log in as {email}')
+    return opener
+
+
+def drive(base_url, email, path, concurrency, requests):
+    """Run ``requests`` GETs spread over ``concurrency`` clients; return (requests/sec, latencies in ms)"""
+    openers = [login(base_url, email) for _ in range(concurrency)]
+    latencies = []
+    lock = threading.Lock()
+    per_client = max(1, requests // concurrency)
+
+    def client(opener):
+        mine = []
+        for _ in range(per_client):
+            start = time.perf_counter()
+            with opener.open(base_url + path) as response:
+                response.read()
+            mine.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=client, args=(opener,)) for opener in openers]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(latencies) / (time.perf_counter() - start), latencies
+
+
+def queries_per_request(app, email, path, samples=5):
+    client = app.test_client()
+    client.post('/login', data={'email': email, 'password': 'password'})
+    client.get(path)  # warm caches the steady state would have
+    count = [0]
+
+    def counter(*_):
+        count[0] += 1
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', counter)
+    try:
+        for _ in range(samples):
+            client.get(path).close()
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter)
+    return count[0] / samples
+
+
+def compare(results, baseline, threshold):
+    """Return a list of regressions of results against a baseline"""
+    if baseline.get('page_cache', 'memory') != results['page_cache']:
+        # Older baselines were taken with the default in-memory page cache
+        return [f"baseline was taken with PAGE_CACHE={baseline.get('page_cache', 'memory')}, "
+                f"this run with {results['page_cache']}; re-run with --page-cache to match or save a new one"]
+    problems = []
+    for name, base in baseline['routes'].items():
+        current = results['routes'].get(name)
+        if current is None:
+            continue
+        if current['p95_ms'] > base['p95_ms'] * (1 + threshold):
+            problems.append(f"{name}: p95 {current['p95_ms']:.1f}ms vs {base['p95_ms']:.1f}ms baseline")
+        if current['requests_per_second'] < base['requests_per_second'] * (1 - threshold):
+            problems.append(f"{name}: {current['requests_per_second']:.0f} req/s vs "
+                            f"{base['requests_per_second']:.0f} req/s baseline")
+        if current['queries_per_request'] > base['queries_per_request']:
+            problems.append(f"{name}: {current['queries_per_request']:g} queries/request vs "
+                            f"{base['queries_per_request']:g} baseline")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--products-per-user', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=400, help='requests per route')
+    parser.add_argument('--routes', help='comma-separated subset of routes to run')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--page-cache', default='none', choices=('none', 'memory', 'sqlite'),
+                        help='PAGE_CACHE backend; baselines only compare against the same one')
+    parser.add_argument('--save', metavar='PATH', help='write results as a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH', help='compare against a JSON baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed regression, as a fraction')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    app = create_app(build_config(args, tmpdir))
+    email, routes = prepare(app, args)
+    if args.routes:
+        routes = {name: path for name, path in routes.items() if name in args.routes.split(',')}
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    results = {'concurrency': args.concurrency, 'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0],
+               'page_cache': args.page_cache, 'routes': {}}
+    print(f"{'route':16} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}")
+    for name, path in routes.items():
+        drive(base_url, email, path, args.concurrency, args.concurrency * 2)  # warm up
+        rps, latencies = drive(base_url, email, path, args.concurrency, args.requests)
+        p50, p95, p99 = (statistics.quantiles(latencies, n=100)[i] for i in (49, 94, 98))
+        queries = queries_per_request(app, email, path)
+        results['routes'][name] = {'requests_per_second': round(rps, 1), 'p50_ms': round(p50, 2),
+                                   'p95_ms': round(p95, 2), 'p99_ms': round(p99, 2),
+                                   'queries_per_request': round(queries, 2)}
+        print(f'{name:16} {rps:8.0f} {p50:8.1f} {p95:8.1f} {p99:8.1f} {queries:8g}')
+    server.shutdown()
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Baseline written to {args.save}')
+    if args.compare:
+        with open(args.compare) as f:
+            problems = compare(results, json.load(f), args.threshold)
+        for problem in problems:
+            print('REGRESSION ' + problem)
+        if problems:
+            sys.exit(1)
+        print(f'No route regressed by more than {args.threshold:.0%}.')
+
+
+if __name__ == '__main__':
+    main()
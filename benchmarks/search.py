@@ -0,0 +1,104 @@
+"""
+Benchmark product search: full-text index vs the old leading-wildcard LIKE scan
+Run this with: python benchmarks/search.py [--products 1000000] [--database-url URL]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from models import db, User, Product
+from pagination import paginate, RELEVANCE_SORT
+from search import init_search, apply_search
+
+WORDS = ['galaxy', 'iphone', 'macbook', 'bravia', 'walkman', 'kettle', 'blender', 'treadmill', 'speaker',
+         'router', 'monitor', 'keyboard', 'camera', 'drone', 'printer', 'toaster', 'heater', 'vacuum']
+BRANDS = ['Samsung', 'Apple', 'Sony', 'Philips', 'Bosch', 'Dell', 'Canon', 'Dyson', 'Logitech', 'JBL']
+CATEGORIES = ['Electronics', 'Kitchen Appliances', 'Furniture', 'Sports Equipment', 'Books', 'Clothing']
+QUERIES = ['sam', 'galaxy', 'sony walk', 'kitchen', 'zzz']
+
+
+def populate(total, users, rng, batch=20000):
+    for start in range(0, total, batch):
+        rows = []
+        for i in range(start, min(start + batch, total)):
+            purchase = date(2020, 1, 1) + timedelta(days=rng.randint(0, 2000))
+            rows.append({
+                'name': f'{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {i}',
+                'brand': rng.choice(BRANDS),
+                'category': rng.choice(CATEGORIES),
+                'purchase_date': purchase,
+                'warranty_duration': 12,
+                'price': 100.0,
+                'expiry_date': purchase + timedelta(days=360),
+                'user_id': users[i % len(users)],
+            })
+        db.session.execute(Product.__table__.insert(), rows)
+        db.session.commit()
+
+
+def like_search(user_id, q):
+    return Product.query.filter_by(user_id=user_id).filter(
+        Product.name.contains(q) | Product.brand.contains(q) | Product.category.contains(q)
+    ).order_by(Product.expiry_date, Product.id).limit(25).all()
+
+
+def fts_search(user_id, q):
+    query, rank = apply_search(Product.query.filter_by(user_id=user_id), q, user_id)
+    return paginate(query, sort=RELEVANCE_SORT, per_page=24, rank=rank).items
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--products', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'benchmark'
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url or \
+        f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    db.init_app(app)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        init_search()
+        users = []
+        for n in range(args.users):
+            user = User(email=f'bench{n}@example.com', password_hash='x')
+            db.session.add(user)
+            users.append(user)
+        db.session.commit()
+        users = [user.id for user in users]
+
+        start = time.perf_counter()
+        populate(args.products, users, random.Random(42))
+        print(f'Inserted {args.products} products (index kept in sync) in {time.perf_counter() - start:.1f}s')
+
+        print(f"{'query':>12} {'like ms':>10} {'fts ms':>10}")
+        for q in QUERIES:
+            like_ms = timed(lambda: like_search(users[0], q), args.repeat)
+            fts_ms = timed(lambda: fts_search(users[0], q), args.repeat)
+            print(f'{q:>12} {like_ms:>10.2f} {fts_ms:>10.2f}')
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Write throughput and "database is locked" errors with several processes sharing one SQLite
+file, as gunicorn workers do: rollback journal and default settings vs SQLITE_PRAGMAS (WAL)
+Run this with: python benchmarks/sqlite_concurrency.py [--writers 4] [--readers 4] [--seconds 10]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.exc import OperationalError
+from config import Config
+from models import db, Product, User
+from seed import generate_synthetic
+from stats import user_stats, upcoming_products
+
+
+def make_app(path, pragmas):
+    from app import create_app
+
+    class BenchmarkConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+        SQLALCHEMY_ENGINE_OPTIONS = {}
+        SQLALCHEMY_BINDS = {}
+        SQLITE_PRAGMAS = pragmas
+        JOBS_EXECUTOR = 'worker'
+        PAGE_CACHE = 'none'
+    return create_app(BenchmarkConfig)
+
+
+def writer(path, pragmas, user_id, seconds, results):
+    """Add one product per transaction, as the add-product form does"""
+    app = make_app(path, pragmas)
+    done = errors = 0
+    today = date.today()
+    with app.app_context():
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            db.session.add(Product(name=f'Product {done}', brand='Bench', category='Electronics',
+                                   purchase_date=today, warranty_duration=12, price=100.0,
+                                   expiry_date=today + timedelta(days=365), user_id=user_id))
+            try:
+                db.session.commit()
+                done += 1
+            except OperationalError:
+                db.session.rollback()
+                errors += 1
+    results.put(('write', done, errors))
+
+
+def reader(path, pragmas, user_id, seconds, results):
+    """Read what the dashboard reads"""
+    app = make_app(path, pragmas)
+    done = errors = 0
+    with app.app_context():
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            try:
+                user_stats(user_id)
+                upcoming_products(user_id)
+                db.session.commit()
+                done += 1
+            except OperationalError:
+                db.session.rollback()
+                errors += 1
+    results.put(('read', done, errors))
+
+
+def run(label, pragmas, args):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = make_app(path, pragmas)
+    with app.app_context():
+        db.create_all()
+        generate_synthetic(max(args.writers, args.readers), args.products, assets=False)
+        user_ids = [user.id for user in User.query.order_by(User.id)]
+        db.session.remove()
+        db.engine.dispose()
+
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=writer, args=(path, pragmas, user_ids[n], args.seconds, results))
+                 for n in range(args.writers)]
+    processes += [multiprocessing.Process(target=reader, args=(path, pragmas, user_ids[n], args.seconds, results))
+                  for n in range(args.readers)]
+    for process in processes:
+        process.start()
+    totals = {'write': [0, 0], 'read': [0, 0]}
+    for _ in processes:
+        kind, done, errors = results.get()
+        totals[kind][0] += done
+        totals[kind][1] += errors
+    for process in processes:
+        process.join()
+    (writes, write_errors), (reads, read_errors) = totals['write'], totals['read']
+    print(f'{label:26} {writes / args.seconds:9.0f} {write_errors:9d} {reads / args.seconds:9.0f} {read_errors:9d}')
+    return writes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--products', type=int, default=1000, help='Products per user before the run')
+    args = parser.parse_args()
+
+    print(f'{args.writers} writer and {args.readers} reader processes for {args.seconds:g}s each')
+    print(f"{'settings':26} {'writes/s':>9} {'w errors':>9} {'reads/s':>9} {'r errors':>9}")
+    before = run('before: rollback journal', {}, args)
+    after = run('after: SQLITE_PRAGMAS', Config.SQLITE_PRAGMAS, args)
+    print(f'write throughput x{after / max(before, 1):.1f}')
+
+
+if __name__ == '__main__':
+    main()
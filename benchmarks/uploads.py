@@ -0,0 +1,111 @@
+"""
+Benchmark repeated /uploads fetches: the old OR ownership query plus plain send_file
+against the indexed lookup with blob ETags, 304s and X-Accel-Redirect
+Run this with: python benchmarks/uploads.py [--products 20000] [--requests 2000]
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, send_from_directory
+from werkzeug.datastructures import FileStorage
+from models import db, User, Product, create_missing_indexes
+from storage import save_product_file, user_owns_file, send_upload
+
+
+def build(app, products, rng):
+    upload_folder = app.config['UPLOAD_FOLDER']
+    users = [User(email=f'user{i}@example.com', password_hash='x') for i in range(10)]
+    db.session.add_all(users)
+    db.session.commit()
+    db.session.bulk_insert_mappings(Product, [{
+        'name': f'Product {i}', 'brand': 'Brand', 'category': 'Category',
+        'purchase_date': date(2024, 1, 1), 'warranty_duration': 12, 'price': 100.0,
+        'expiry_date': date(2025, 1, 1), 'user_id': rng.choice(users).id,
+        'receipt_path': f'{i}_receipt_r.pdf', 'product_image': f'{i}_image_p.png',
+    } for i in range(products)])
+    db.session.commit()
+    product = Product.query.order_by(Product.id.desc()).first()
+    # A 200 KiB legacy receipt, and an image stored as a blob
+    legacy = product.receipt_path
+    with open(os.path.join(upload_folder, legacy), 'wb') as f:
+        f.write(os.urandom(200 * 1024))
+    save_product_file(upload_folder, product, 'image', FileStorage(io.BytesIO(os.urandom(200 * 1024)), 'p.png'))
+    blob = product.product_image
+    db.session.commit()
+    return product.user_id, legacy, blob
+
+
+def rate(client, url, requests, headers=None):
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = client.get(url, headers=headers or {})
+        response.close()
+    return requests / (time.perf_counter() - start), response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'benchmark'
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    app.config['UPLOAD_FOLDER'] = tmpdir
+    db.init_app(app)
+    state = {}
+
+    @app.route('/before/<path:filename>')
+    def before(filename):
+        product = Product.query.filter(
+            (Product.receipt_path == filename) | (Product.product_image == filename),
+            Product.user_id == state['user_id']
+        ).first()
+        if not product:
+            return 'denied', 404
+        return send_from_directory(tmpdir, filename)
+
+    @app.route('/after/<path:filename>')
+    def after(filename):
+        if not user_owns_file(state['user_id'], filename):
+            return 'denied', 404
+        return send_upload(tmpdir, filename, state.get('accel'))
+
+    with app.app_context():
+        db.create_all()
+        create_missing_indexes()
+        state['user_id'], legacy, blob = build(app, args.products, random.Random(42))
+
+    client = app.test_client()
+    cases = [
+        ('before: OR query, full body', f'/before/{legacy}', None),
+        ('before: OR query, If-None-Match (304)', f'/before/{legacy}', 'etag'),
+        ('after: legacy file, full body', f'/after/{legacy}', None),
+        ('after: blob, full body', f'/after/{blob}', None),
+        ('after: blob, If-None-Match (304)', f'/after/{blob}', 'etag'),
+        ('after: blob, Range 0-1023 (206)', f'/after/{blob}', {'Range': 'bytes=0-1023'}),
+    ]
+    for label, url, headers in cases:
+        if headers == 'etag':
+            headers = {'If-None-Match': client.get(url).headers['ETag']}
+        per_second, response = rate(client, url, args.requests, headers)
+        print(f'{label:40} {response.status_code}  {per_second:7.0f} req/s')
+    print(f"Cache-Control for blobs: {client.get(f'/after/{blob}').headers['Cache-Control']}")
+    state['accel'] = '/protected-uploads/'
+    per_second, response = rate(client, f'/after/{blob}', args.requests)
+    print(f"{'after: blob, X-Accel-Redirect':40} {response.status_code}  {per_second:7.0f} req/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+import hashlib
+import json
+from flask import current_app
+from sqlalchemy import delete, event, exists, inspect, select, text, update
+from models import db, Category, Product
+from page_cache import data_version
+
+# Names returned per autocomplete request
+SUGGESTION_LIMIT = 10
+
+# Sorts after any character, so keys starting with p are the range [p, p + PREFIX_END)
+PREFIX_END = '\U0010ffff'
+
+# (user, name) pairs resolved per statement while backfilling
+BACKFILL_BATCH_SIZE = 500
+
+
+def name_key(name):
+    return name.lower()
+
+
+def _insert_ignoring_existing(connection):
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(Category).on_conflict_do_nothing(index_elements=['user_id', 'name'])
+
+
+def category_ids(pairs, connection=None):
+    """Map (user_id, name) pairs to category ids, creating the categories that do not exist yet"""
+    pairs = set(pairs)
+    if not pairs:
+        return {}
+    connection = connection or db.session.connection()
+
+    def lookup():
+        rows = connection.execute(select(Category.user_id, Category.name, Category.id).where(
+            Category.user_id.in_({user_id for user_id, _ in pairs}), Category.name.in_({name for _, name in pairs})))
+        return {(user_id, name): id for user_id, name, id in rows if (user_id, name) in pairs}
+
+    ids = lookup()
+    missing = pairs - ids.keys()
+    if missing:
+        # Another request may create the same category meanwhile; whichever row wins is used
+        connection.execute(_insert_ignoring_existing(connection),
+                           [{'user_id': user_id, 'name': name, 'name_key': name_key(name)}
+                            for user_id, name in sorted(missing)])
+        ids = lookup()
+    return ids
+
+
+def category_id(user_id, name):
+    """The id of a user's category, or None if they have no such category"""
+    return db.session.scalar(select(Category.id).where(Category.user_id == user_id, Category.name == name))
+
+
+def user_categories(user_id):
+    """A user's category names in alphabetical order, for filter and form dropdowns"""
+    return db.session.scalars(
+        select(Category.name).where(Category.user_id == user_id).order_by(Category.name_key)).all()
+
+
+def suggest_categories(user_id, prefix, limit=SUGGESTION_LIMIT):
+    """Category names starting with prefix (case-insensitive), read from one index range"""
+    stmt = select(Category.name).where(Category.user_id == user_id).order_by(Category.name_key).limit(limit)
+    key = name_key(prefix)
+    if key:
+        stmt = stmt.where(Category.name_key >= key, Category.name_key < key + PREFIX_END)
+    return db.session.scalars(stmt).all()
+
+
+def suggestion_etag(user_id, prefix):
+    """Changes whenever the user's products (and so their categories) do"""
+    parts = ('categories', user_id, data_version(user_id), name_key(prefix))
+    return hashlib.sha256('|'.join(str(part) for part in parts).encode()).hexdigest()[:32]
+
+
+def cached_suggestions(user_id, prefix, etag):
+    """suggest_categories() through the page cache backend, keyed by suggestion_etag()"""
+    cache = current_app.extensions.get('page_cache')
+    cached = cache.get(etag) if cache is not None else None
+    if cached is not None:
+        return json.loads(cached)
+    names = suggest_categories(user_id, prefix)
+    if cache is not None:
+        cache.set(etag, json.dumps(names).encode())
+    return names
+
+
+def migrate_categories():
+    """Add product.category_id to an older database and point every product at its category.
+
+    Safe to re-run; returns (categories resolved, products updated).
+    """
+    columns = {column['name'] for column in inspect(db.engine).get_columns('product')}
+    if 'category_id' not in columns:
+        db.session.execute(text('ALTER TABLE product ADD COLUMN category_id INTEGER REFERENCES category (id)'))
+    pairs = db.session.execute(
+        select(Product.user_id, Product.category).where(Product.category_id.is_(None)).distinct()).all()
+    for start in range(0, len(pairs), BACKFILL_BATCH_SIZE):
+        category_ids(tuple(pair) for pair in pairs[start:start + BACKFILL_BATCH_SIZE])
+    updated = db.session.execute(update(Product).where(Product.category_id.is_(None)).values(
+        category_id=select(Category.id).where(Category.user_id == Product.user_id,
+                                              Category.name == Product.category).scalar_subquery())).rowcount
+    db.session.commit()
+    return len(pairs), updated
+
+
+@event.listens_for(db.session, 'before_flush')
+def _assign_categories(session, flush_context, instances):
+    """Point new and re-categorised products at their category, creating it if needed"""
+    assign = [obj for obj in session.new if isinstance(obj, Product)]
+    emptied = session.info.setdefault('emptied_categories', set())
+    for obj in session.dirty:
+        if not isinstance(obj, Product):
+            continue
+        attrs = inspect(obj).attrs
+        if obj.category_id is None or attrs.category.history.has_changes() or attrs.user_id.history.has_changes():
+            emptied.add(obj.category_id)
+            assign.append(obj)
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            emptied.add(obj.category_id)
+    if assign:
+        ids = category_ids(((obj.user_id, obj.category) for obj in assign), session.connection())
+        for obj in assign:
+            obj.category_id = ids[(obj.user_id, obj.category)]
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _forget_emptied_categories(session, previous_transaction):
+    if not previous_transaction.nested:
+        session.info.pop('emptied_categories', None)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _drop_empty_categories(session, flush_context):
+    """Remove categories whose last product was deleted or moved, as the old DISTINCT lists did"""
+    emptied = session.info.pop('emptied_categories', set()) - {None}
+    if emptied:
+        session.connection().execute(delete(Category).where(
+            Category.id.in_(emptied),
+            ~exists().where(Product.user_id == Category.user_id, Product.category_id == Category.id)))
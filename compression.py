@@ -0,0 +1,173 @@
+import re
+import zlib
+from flask import Response, current_app, get_flashed_messages, request, stream_template
+
+# Responses smaller than this are sent as they are; compressing them saves too little
+DEFAULT_MIN_SIZE = 500
+
+# Streamed pages are written (and the compressor flushed) in pieces of about this size
+STREAM_CHUNK_BYTES = 16 * 1024
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/tab-separated-values', 'text/javascript',
+    'application/javascript', 'application/json', 'application/x-ndjson', 'image/svg+xml',
+}
+
+# Whitespace inside these is content, and comments must be seen whole
+_PROTECTED = re.compile(r'<(pre|textarea)\b.*?</\1>|<!--.*?-->', re.S | re.I)
+_OPENERS = re.compile(r'<(?:pre|textarea)\b|<!--', re.I)
+
+
+def minify_html(html):
+    """Drop comments, indentation and blank lines outside <pre> and <textarea>.
+
+    Line breaks are kept, so line comments in inline scripts still end where they did.
+    """
+    out = []
+    position = 0
+    for match in _PROTECTED.finditer(html):
+        out.append(_collapse(html[position:match.start()]))
+        if not match.group().startswith('<!--') or match.group().startswith('<!--['):
+            out.append(match.group())
+        position = match.end()
+    out.append(_collapse(html[position:]))
+    return ''.join(out)
+
+
+def _edge(whitespace):
+    return '\n' if '\n' in whitespace else whitespace[:1]
+
+
+def _collapse(text):
+    # Stripping line by line is several times faster than a whitespace regex
+    body = text.strip()
+    if not body:
+        return _edge(text)
+    lead = text[:len(text) - len(text.lstrip())]
+    trail = text[len(text.rstrip()):]
+    return _edge(lead) + '\n'.join(filter(None, map(str.strip, body.split('\n')))) + _edge(trail)
+
+
+class StreamingMinifier:
+    """Minify HTML arriving in arbitrary pieces, holding back an unfinished tail"""
+
+    def __init__(self):
+        self._pending = ''
+
+    def feed(self, text):
+        text = self._pending + text
+        cut = text.rfind('>') + 1
+        # Never split a <pre>, <textarea> or comment between two pieces
+        for opener in _OPENERS.finditer(text, 0, cut):
+            if not _PROTECTED.match(text, opener.start()):
+                cut = opener.start()
+                break
+        self._pending = text[cut:]
+        return minify_html(text[:cut])
+
+    def close(self):
+        text, self._pending = self._pending, ''
+        return minify_html(text)
+
+
+def _encoder(encoding, level):
+    """A (compress, flush, finish) triple for a streaming encoder"""
+    if encoding == 'br':
+        import brotli
+        compressor = brotli.Compressor(quality=4)
+        return compressor.process, compressor.flush, compressor.finish
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 writes a gzip container
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    if accepted['br']:
+        try:
+            import brotli  # noqa: F401
+            return 'br'
+        except ImportError:
+            pass
+    return 'gzip' if accepted['gzip'] else None
+
+
+def _stream(chunks, charset, minify, encoding, level):
+    minifier = StreamingMinifier() if minify else None
+    compress, flush, finish = _encoder(encoding, level) if encoding else (None, None, None)
+
+    def encode(text, last=False):
+        data = text.encode(charset) if isinstance(text, str) else text
+        if compress is None:
+            return data
+        # Flushing after every piece lets the browser start on it straight away
+        return compress(data) + (finish() if last else flush())
+
+    for chunk in chunks:
+        if minifier is not None:
+            chunk = minifier.feed(chunk.decode(charset) if isinstance(chunk, bytes) else chunk)
+        if chunk:
+            yield encode(chunk)
+    tail = encode(minifier.close() if minifier else b'', last=True)
+    if tail:
+        yield tail
+
+
+def compress_response(response):
+    """Minify HTML and gzip/brotli-encode text responses the client accepts"""
+    config = current_app.config
+    if (not config.get('COMPRESS_RESPONSES', True) or response.direct_passthrough
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    minify = config.get('MINIFY_HTML', True) and response.mimetype == 'text/html'
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding()
+    level = config.get('COMPRESS_LEVEL', 6)
+
+    if response.is_streamed:
+        response.response = _stream(response.response, response.charset, minify, encoding, level)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config.get('COMPRESS_MIN_SIZE', DEFAULT_MIN_SIZE):
+            return response
+        if minify:
+            data = minify_html(data.decode(response.charset)).encode(response.charset)
+        if encoding:
+            compress, _, finish = _encoder(encoding, level)
+            data = compress(data) + finish()
+        response.set_data(data)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+        # The encoded bytes differ from the identity ones, so the validator may only be weak
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+    return response
+
+
+def _coalesce(chunks, size):
+    buffer = []
+    buffered = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield ''.join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_page(template_name, **context):
+    """Stream a template in STREAM_CHUNK_BYTES pieces so the top of the page is sent early.
+
+    Flashed messages are taken from the session first: the session cookie has
+    been written by the time the template reads them.
+    """
+    get_flashed_messages(with_categories=True)
+    return Response(_coalesce(stream_template(template_name, **context), STREAM_CHUNK_BYTES), mimetype='text/html')
+
+
+def init_compression(app):
+    app.after_request(compress_response)
@@ -16,21 +16,107 @@ class Config:
         # Ensure SSL mode is required and enable pool pre-ping to handle
         # Render's occasional closed connections.
         SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
-        # Add engine options for SSL and liveliness checks
+        # Add engine options for SSL and liveliness checks. Each worker process holds up to
+        # DB_POOL_SIZE + DB_MAX_OVERFLOW connections, so size them against max_connections
         SQLALCHEMY_ENGINE_OPTIONS = {
             'connect_args': {'sslmode': 'require'},
             'pool_pre_ping': True,
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+            'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+            'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
         }
     else:
         # SQLite for local development
         _db_path = os.path.join(INSTANCE_PATH, 'warranty.db')
         SQLALCHEMY_DATABASE_URI = f'sqlite:///{_db_path}'.replace('\\', '/')
         SQLALCHEMY_ENGINE_OPTIONS = {}
+
+    # Set on every new SQLite connection (see db_tuning.py). WAL lets readers run alongside
+    # the single writer, and writers wait busy_timeout ms for the lock instead of failing.
+    # synchronous=NORMAL is durable across application crashes; a power cut can lose the last
+    # commits but never corrupts the file. cache_size is negative KiB; SQLITE_PRAGMAS = {} turns all off
+    SQLITE_PRAGMAS = {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64 * 1024)),
+    }
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # PostgreSQL cancels a statement run for a web request after this many ms (0 disables it).
+    # CLI commands and background jobs run without a limit (see db_tuning.py)
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+
+    # Optional read replicas (comma-separated URLs, same engine options as the primary).
+    # GET/HEAD requests read from one; writes, and a user's requests for REPLICA_STICKY_SECONDS
+    # after they write, use the primary. An unreachable replica is retried after REPLICA_RETRY_SECONDS
+    SQLALCHEMY_BINDS = {f'replica{index}': url.strip() for index, url in enumerate(
+        url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip())}
+    REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+    REPLICA_RETRY_SECONDS = float(os.environ.get('REPLICA_RETRY_SECONDS', 30))
+    # A replica that answered a connection probe is used without probing again for this long
+    REPLICA_HEALTH_SECONDS = float(os.environ.get('REPLICA_HEALTH_SECONDS', 5))
     
     # Upload folder configuration
     UPLOAD_FOLDER = 'static/uploads'
     ALLOWED_EXTENSIONS = {'pdf', 'jpg', 'jpeg', 'png', 'webp', 'avif'}
+
+    # Let the front-end server stream authorised downloads instead of the Python worker.
+    # USE_X_SENDFILE is for Apache/lighttpd; UPLOADS_ACCEL_REDIRECT is the internal nginx
+    # location (e.g. /protected-uploads/) aliased to UPLOAD_FOLDER.
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE') == '1'
+    UPLOADS_ACCEL_REDIRECT = os.environ.get('UPLOADS_ACCEL_REDIRECT')
+
+    # Seconds a worker process reuses a logged-in user without querying the database
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+    # A password change writes the user's new session version here, and every worker checks it
+    # per request to drop old sessions at once. Must be shared by all workers (one machine or a
+    # shared volume); with workers on several machines set USER_CACHE_TTL=0 instead
+    SESSION_STAMP_DIR = os.environ.get('SESSION_STAMP_DIR', os.path.join(INSTANCE_PATH, 'session-stamps'))
+
+    # Rendered dashboard/product pages, keyed by user, URL and data version. PAGE_CACHE is
+    # 'memory' (LRU per worker), 'sqlite' (one file shared by the workers on a machine) or 'none'.
+    # BUILD_ID (e.g. the git commit) changes every ETag on deploy; templates are fingerprinted otherwise
+    PAGE_CACHE = os.environ.get('PAGE_CACHE', 'memory')
+    PAGE_CACHE_SIZE = int(os.environ.get('PAGE_CACHE_SIZE', 1000))
+    # Total size of the pages a 'memory' cache keeps in each worker process
+    PAGE_CACHE_MAX_BYTES = int(os.environ.get('PAGE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    PAGE_CACHE_PATH = os.environ.get('PAGE_CACHE_PATH', os.path.join(INSTANCE_PATH, 'page_cache.sqlite'))
+    BUILD_ID = os.environ.get('BUILD_ID') or os.environ.get('RENDER_GIT_COMMIT')
+
+    # Minify HTML and gzip/brotli text responses (set COMPRESS_RESPONSES=0 when a proxy does it)
+    COMPRESS_RESPONSES = os.environ.get('COMPRESS_RESPONSES', '1') == '1'
+    MINIFY_HTML = os.environ.get('MINIFY_HTML', '1') == '1'
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+
+    # Request instrumentation served at /metrics (Prometheus). Set METRICS_TOKEN to require
+    # "Authorization: Bearer <token>"; without it /metrics is public (block it at the proxy) and
+    # /metrics/slow-queries returns 404. SERVER_TIMING=1 adds a Server-Timing header to responses
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    SERVER_TIMING = os.environ.get('SERVER_TIMING') == '1'
+    SLOW_QUERY_SECONDS = float(os.environ.get('SLOW_QUERY_SECONDS', 0.1))
+
+    # Background jobs: 'worker' leaves them to `python worker.py`, so thumbnails and reports do
+    # not compete with requests in the web processes; 'thread' runs them on a pool inside each
+    # web process after the request commits (the default for `python app.py` only)
+    JOBS_EXECUTOR = os.environ.get('JOBS_EXECUTOR', 'worker')
+    JOBS_THREADS = int(os.environ.get('JOBS_THREADS', 2))
+
+    # Expiry reminders: 'smtp' when MAIL_SERVER is set, otherwise 'console';
+    # 'file' appends each message to NOTIFICATION_FILE
+    MAIL_SERVER = os.environ.get('MAIL_SERVER')
+    MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
+    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', '1') == '1'
+    MAIL_USE_SSL = os.environ.get('MAIL_USE_SSL') == '1'
+    MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
+    MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    MAIL_FROM = os.environ.get('MAIL_FROM', 'Digital Warranty <no-reply@localhost>')
+    NOTIFICATION_TRANSPORT = os.environ.get('NOTIFICATION_TRANSPORT', 'smtp' if MAIL_SERVER else 'console')
+    NOTIFICATION_FILE = os.environ.get('NOTIFICATION_FILE', os.path.join(INSTANCE_PATH, 'outbox.eml'))
     
     @staticmethod
     def ensure_dirs():
@@ -0,0 +1,55 @@
+import sqlite3
+from flask import has_request_context
+from sqlalchemy import event
+from models import db
+
+
+def _pragma_setter(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                try:
+                    cursor.execute(f'PRAGMA {name}={value}')
+                except sqlite3.OperationalError:
+                    # A read-only connection (e.g. a replica opened with mode=ro) keeps
+                    # the journal mode its file was written with
+                    if name != 'journal_mode':
+                        raise
+        finally:
+            cursor.close()
+    return set_pragmas
+
+
+def _statement_timeout_setter(timeout_ms):
+    def set_statement_timeout(dbapi_connection, connection_record, connection_proxy):
+        wanted = timeout_ms if has_request_context() else 0
+        if connection_record.info.get('statement_timeout') == wanted:
+            return
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f'SET statement_timeout = {int(wanted)}')
+        finally:
+            cursor.close()
+        # Committed, so returning the connection to the pool (a rollback) does not undo it
+        dbapi_connection.commit()
+        connection_record.info['statement_timeout'] = wanted
+    return set_statement_timeout
+
+
+def init_db_tuning(app):
+    """Apply SQLITE_PRAGMAS to every new connection of the app's SQLite engines, and
+    DB_STATEMENT_TIMEOUT_MS to PostgreSQL connections checked out by web requests.
+
+    Connections used outside a request (CLI commands such as init-db and seed-synthetic,
+    background jobs) get no statement timeout. The SET is only sent when a pooled
+    connection switches between the two. Creating the engines does no I/O.
+    """
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    timeout_ms = app.config.get('DB_STATEMENT_TIMEOUT_MS')
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite' and pragmas:
+                event.listen(engine, 'connect', _pragma_setter(pragmas))
+            elif engine.dialect.name == 'postgresql' and timeout_ms:
+                event.listen(engine, 'checkout', _statement_timeout_setter(timeout_ms))
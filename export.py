@@ -0,0 +1,82 @@
+import csv
+import json
+import zlib
+from io import StringIO
+from sqlalchemy import select
+from models import db, Product
+
+# Rows fetched from the database per round trip (server-side cursor on PostgreSQL)
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_COLUMNS = [
+    ('Name', Product.name),
+    ('Brand', Product.brand),
+    ('Category', Product.category),
+    ('Purchase Date', Product.purchase_date),
+    ('Warranty Duration', Product.warranty_duration),
+    ('Price', Product.price),
+    ('Expiry Date', Product.expiry_date),
+]
+
+# Format -> (file extension, mimetype)
+EXPORT_FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'tsv': ('tsv', 'text/tab-separated-values'),
+    'jsonl': ('jsonl', 'application/x-ndjson'),
+}
+
+
+def _batches(user_id):
+    """Yield lists of plain row tuples without hydrating Product objects"""
+    stmt = select(*[column for _, column in EXPORT_COLUMNS]).where(
+        Product.user_id == user_id
+    ).order_by(Product.expiry_date, Product.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    result = db.session.execute(stmt)
+    try:
+        for partition in result.partitions():
+            yield partition
+    finally:
+        result.close()
+
+
+def _format_row(row):
+    return [value.strftime('%Y-%m-%d') if hasattr(value, 'strftime') else value for value in row]
+
+
+def _delimited(user_id, delimiter):
+    buffer = StringIO()
+    writer = csv.writer(buffer, delimiter=delimiter)
+    writer.writerow([header for header, _ in EXPORT_COLUMNS])
+    for batch in _batches(user_id):
+        writer.writerows(_format_row(row) for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only, for users with no products
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _json_lines(user_id):
+    keys = [column.key for _, column in EXPORT_COLUMNS]
+    for batch in _batches(user_id):
+        yield ''.join(json.dumps(dict(zip(keys, _format_row(row))), ensure_ascii=False) + '\n' for row in batch)
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_rows(user_id, fmt='csv', gzip=False):
+    """Return a generator of encoded chunks for a user's products in the given format"""
+    if fmt == 'jsonl':
+        chunks = _json_lines(user_id)
+    else:
+        chunks = _delimited(user_id, '\t' if fmt == 'tsv' else ',')
+    chunks = (chunk.encode('utf-8') for chunk in chunks)
+    return _gzip(chunks) if gzip else chunks
@@ -30,4 +30,8 @@ class SettingsForm(FlaskForm):
     current_password = PasswordField('Current Password', validators=[DataRequired()])
     new_password = PasswordField('New Password', validators=[Length(min=6)])
     confirm_password = PasswordField('Confirm New Password', validators=[EqualTo('new_password')])
-    submit = SubmitField('Update Settings')
\ No newline at end of file
+    submit = SubmitField('Update Settings')
+
+class ImportForm(FlaskForm):
+    file = FileField('CSV or JSON Lines file', validators=[DataRequired()])
+    submit = SubmitField('Import Products')
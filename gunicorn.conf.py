@@ -0,0 +1,17 @@
+"""
+Gunicorn settings, loaded automatically when gunicorn starts in this directory
+"""
+
+import os
+import tempfile
+
+# Each worker keeps its own metrics; they are shared through files in this
+# directory so /metrics reports the whole server whichever worker answers.
+# This must be set before prometheus_client is first imported.
+if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='warranty-metrics-')
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
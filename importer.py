@@ -0,0 +1,117 @@
+import csv
+import io
+import json
+import time
+from werkzeug.datastructures import MultiDict
+from forms import ProductForm
+from models import db, Product, expiry_for
+from stats import record_bulk_insert
+from page_cache import bump_data_version
+from categories import category_ids
+
+# Rows per bulk INSERT, and INSERT batches per transaction
+IMPORT_CHUNK_SIZE = 1000
+IMPORT_CHUNKS_PER_TRANSACTION = 10
+
+# Form fields that are read from an import row
+IMPORT_FIELDS = ('name', 'brand', 'category', 'purchase_date', 'warranty_duration', 'price', 'receipt')
+
+# Report at most this many failing rows; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportReport:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []  # (row number, {field: [messages]})
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return (self.imported + self.failed) / self.seconds if self.seconds else 0.0
+
+
+def _normalize(key):
+    # Accept both the CSV export headers ("Purchase Date") and field names ("purchase_date")
+    key = (key or '').strip().lower().replace(' ', '_')
+    return 'warranty_duration' if key.startswith('warranty_duration') else key
+
+
+def read_rows(stream, fmt):
+    """Yield dicts from a binary CSV or JSON Lines stream without reading it all into memory"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'jsonl':
+        for line in text:
+            line = line.strip()
+            if line:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield {_normalize(k): v for k, v in row.items()} if isinstance(row, dict) else None
+    else:
+        for row in csv.DictReader(text):
+            yield {_normalize(k): v for k, v in row.items()}
+
+
+def _validate(form, row):
+    """Validate a row with ProductForm's rules; return (values, errors)"""
+    if row is None:
+        return None, {'row': ['Not a JSON object.']}
+    # Re-processing one bound form is much cheaper than building a form per row
+    form.process(MultiDict((field, '' if row.get(field) is None else str(row[field])) for field in IMPORT_FIELDS))
+    if not form.validate():
+        return None, form.errors
+    return {field: getattr(form, field).data for field in IMPORT_FIELDS}, None
+
+
+def _flush(rows, user_id):
+    # Expiry is derived for the whole batch at once, then inserted in one statement
+    # Bulk inserts skip the flush hooks, so categories are resolved here, once per name
+    ids = category_ids((user_id, row['category']) for row in rows)
+    for row in rows:
+        row['user_id'] = user_id
+        row['expiry_date'] = expiry_for(row['purchase_date'], row['warranty_duration'])
+        row['category_id'] = ids[(user_id, row['category'])]
+    db.session.bulk_insert_mappings(Product, rows)
+    record_bulk_insert(rows)
+    bump_data_version([user_id])
+
+
+def import_products(rows, user_id):
+    """Validate and insert product rows for a user in batched transactions"""
+    report = ImportReport()
+    form = ProductForm(formdata=None, meta={'csrf': False})
+    start = time.perf_counter()
+    batch = []
+    pending_chunks = 0
+    number = 0
+    try:
+        for number, row in enumerate(rows, start=1):
+            values, errors = _validate(form, row)
+            if errors:
+                report.failed += 1
+                if len(report.errors) < MAX_REPORTED_ERRORS:
+                    report.errors.append((number, errors))
+                continue
+            batch.append(values)
+            if len(batch) >= IMPORT_CHUNK_SIZE:
+                _flush(batch, user_id)
+                report.imported += len(batch)
+                batch = []
+                pending_chunks += 1
+                if pending_chunks >= IMPORT_CHUNKS_PER_TRANSACTION:
+                    db.session.commit()
+                    pending_chunks = 0
+    except (UnicodeDecodeError, csv.Error) as e:
+        # The file cannot be read past this point; keep the rows before it and say where it stopped
+        message = 'The file is not UTF-8 text.' if isinstance(e, UnicodeDecodeError) else f'Malformed CSV: {e}.'
+        report.failed += 1
+        report.errors.append((number + 1, {'file': [message + ' Rows from here on were not imported.']}))
+    if batch:
+        _flush(batch, user_id)
+        report.imported += len(batch)
+    db.session.commit()
+    report.seconds = time.perf_counter() - start
+    return report
@@ -0,0 +1,159 @@
+import json
+import os
+import socket
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event, select, update, or_
+from models import db, Job
+from page_cache import bump_data_version
+
+# Failed jobs are retried after RETRY_BASE_SECONDS, doubling per attempt
+RETRY_BASE_SECONDS = 10
+
+# A running job not finished within this long is assumed lost with its worker
+LEASE_SECONDS = 10 * 60
+
+# How long an idle worker thread sleeps before polling the table again
+POLL_SECONDS = 1.0
+
+# kind -> function called with the job's JSON payload as keyword arguments
+HANDLERS = {}
+
+# Kinds whose results show up on the owner's pages, so cached pages must be refreshed
+REFRESHES_PAGES = set()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def handler(kind, refreshes_pages=False):
+    """Register a function as the handler for a job kind"""
+    def register(func):
+        HANDLERS[kind] = func
+        if refreshes_pages:
+            REFRESHES_PAGES.add(kind)
+        return func
+    return register
+
+
+def enqueue(kind, user_id=None, max_attempts=3, **payload):
+    """Queue a job in the current transaction; it becomes runnable once that commits"""
+    job = Job(kind=kind, payload=json.dumps(payload), user_id=user_id, max_attempts=max_attempts,
+              run_after=datetime.utcnow())
+    db.session.add(job)
+    db.session.info['jobs_enqueued'] = True
+    return job
+
+
+def _worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def claim(worker):
+    """Atomically take the oldest runnable job; returns it or None"""
+    now = datetime.utcnow()
+    runnable = or_(
+        (Job.status == 'queued') & (Job.run_after <= now),
+        (Job.status == 'running') & (Job.started_at < now - timedelta(seconds=LEASE_SECONDS)),
+    )
+    while True:
+        job_id = db.session.scalar(select(Job.id).where(runnable).order_by(Job.run_after, Job.id).limit(1))
+        if job_id is None:
+            db.session.commit()
+            return None
+        # Compare-and-set, so two workers that picked the same id cannot both win
+        result = db.session.execute(
+            update(Job).where(Job.id == job_id, runnable)
+            .values(status='running', started_at=now, worker=worker, attempts=Job.attempts + 1)
+        )
+        db.session.commit()
+        if result.rowcount:
+            return db.session.get(Job, job_id, populate_existing=True)
+
+
+def run_job(job):
+    """Run a claimed job, recording success, a scheduled retry, or failure"""
+    try:
+        HANDLERS[job.kind](**json.loads(job.payload))
+    except Exception:
+        db.session.rollback()
+        job = db.session.get(Job, job.id, populate_existing=True)
+        job.error = traceback.format_exc(limit=5)
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_after = datetime.utcnow() + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (job.attempts - 1))
+        else:
+            job.status = 'failed'
+            job.finished_at = datetime.utcnow()
+    else:
+        job.status = 'done'
+        job.error = None
+        job.finished_at = datetime.utcnow()
+        if job.user_id is not None and job.kind in REFRESHES_PAGES:
+            bump_data_version([job.user_id])
+    db.session.commit()
+    return job.status
+
+
+def drain(app, worker=None):
+    """Run runnable jobs until none are left; returns how many ran"""
+    worker = worker or _worker_name()
+    count = 0
+    with app.app_context():
+        while True:
+            job = claim(worker)
+            if job is None:
+                return count
+            run_job(job)
+            count += 1
+
+
+def run_worker(app, threads=2, once=False):
+    """Process jobs on a pool of threads; with ``once`` stop when the queue is empty"""
+    stop = threading.Event()
+
+    def loop():
+        worker = _worker_name()
+        while not stop.is_set():
+            ran = drain(app, worker)
+            if once:
+                return
+            if not ran:
+                stop.wait(POLL_SECONDS)
+
+    workers = [threading.Thread(target=loop, daemon=True) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    try:
+        for thread in workers:
+            while thread.is_alive():
+                thread.join(POLL_SECONDS)
+    except KeyboardInterrupt:
+        stop.set()
+
+
+def _start_in_process(app):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=app.config.get('JOBS_THREADS', 2), thread_name_prefix='jobs')
+    _pool.submit(drain, app)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _run_enqueued_jobs(session):
+    if not session.info.pop('jobs_enqueued', False):
+        return
+    # With JOBS_EXECUTOR=worker only `python worker.py` runs jobs
+    app = current_app._get_current_object()
+    if app.config.get('JOBS_EXECUTOR', 'worker') == 'thread':
+        _start_in_process(app)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _forget_enqueued_jobs(session, previous_transaction):
+    if not previous_transaction.nested:
+        session.info.pop('jobs_enqueued', None)
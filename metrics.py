@@ -0,0 +1,173 @@
+import logging
+import os
+import time
+from collections import deque
+from flask import Response, abort, current_app, g, jsonify, has_request_context, request, before_render_template, template_rendered
+from prometheus_client import CollectorRegistry, Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+from prometheus_client import REGISTRY
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('warranty.slow_query')
+
+# Statements slower than this are counted, logged and kept as samples
+DEFAULT_SLOW_QUERY_SECONDS = 0.1
+
+# Most recent slow statements kept per process
+SLOW_QUERY_SAMPLES = 50
+
+REQUEST_SECONDS = Histogram('warranty_request_duration_seconds', 'Time spent handling a request',
+                            ['endpoint', 'method'])
+SQL_STATEMENTS = Histogram('warranty_request_sql_statements', 'SQL statements executed per request', ['endpoint'],
+                           buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 500))
+SQL_SECONDS = Histogram('warranty_request_sql_duration_seconds', 'Time spent in SQL per request', ['endpoint'])
+TEMPLATE_SECONDS = Histogram('warranty_template_render_seconds', 'Time spent rendering a template', ['template'])
+UPLOAD_BYTES = Counter('warranty_upload_bytes_total', 'Bytes of uploaded files written', ['endpoint'])
+SLOW_QUERIES = Counter('warranty_slow_queries_total', 'SQL statements slower than SLOW_QUERY_SECONDS', ['endpoint'])
+PAGE_CACHE_REQUESTS = Counter('warranty_page_cache_requests_total', 'Cached page lookups by outcome', ['result'])
+DATABASE_ROUTES = Counter('warranty_database_routes_total', 'Requests by the database their reads went to',
+                          ['route'])
+
+slow_query_samples = deque(maxlen=SLOW_QUERY_SAMPLES)
+
+
+def _endpoint():
+    # Unmatched URLs share one label so 404 probes cannot blow up the series count
+    return request.url_rule.endpoint if request.url_rule else 'unmatched'
+
+
+def _timings():
+    return g.get('_timings') if has_request_context() else None
+
+
+def record_upload(size):
+    UPLOAD_BYTES.labels(_endpoint() if has_request_context() else 'cli').inc(size)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _timings() is not None:
+        conn.info.setdefault('_query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timings = _timings()
+    starts = conn.info.get('_query_start')
+    if timings is None or not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    timings['sql_count'] += 1
+    timings['sql_seconds'] += elapsed
+    if elapsed >= current_app.config.get('SLOW_QUERY_SECONDS', DEFAULT_SLOW_QUERY_SECONDS):
+        endpoint = _endpoint()
+        SLOW_QUERIES.labels(endpoint).inc()
+        slow_query_samples.append({'endpoint': endpoint, 'seconds': round(elapsed, 4),
+                                   'statement': statement[:500], 'at': time.time()})
+        logger.warning('slow query on %s took %.3fs: %s', endpoint, elapsed, statement[:500])
+
+
+def _before_render(sender, template, context, **extra):
+    timings = _timings()
+    if timings is not None:
+        timings['render_start'] = time.perf_counter()
+
+
+def _rendered(sender, template, context, **extra):
+    timings = _timings()
+    if timings is not None and 'render_start' in timings:
+        elapsed = time.perf_counter() - timings.pop('render_start')
+        timings['render_seconds'] += elapsed
+        TEMPLATE_SECONDS.labels(template.name or 'string').observe(elapsed)
+
+
+def _start_request():
+    g._timings = {'start': time.perf_counter(), 'sql_count': 0, 'sql_seconds': 0.0, 'render_seconds': 0.0}
+
+
+def _record(endpoint, method, timings):
+    elapsed = time.perf_counter() - timings['start']
+    REQUEST_SECONDS.labels(endpoint, method).observe(elapsed)
+    SQL_STATEMENTS.labels(endpoint).observe(timings['sql_count'])
+    SQL_SECONDS.labels(endpoint).observe(timings['sql_seconds'])
+    return elapsed
+
+
+def _finish_request(response):
+    if request.endpoint in ('metrics', 'slow_queries'):
+        g.pop('_timings', None)
+        return response
+    timings = g.get('_timings')
+    if timings is None:
+        return response
+    endpoint = _endpoint()
+    if response.is_streamed:
+        # The template renders (and runs its queries) while the body is sent, after this hook;
+        # the timings stay in g for that and are recorded once the response is closed
+        method = request.method
+        response.call_on_close(lambda: _record(endpoint, method, timings))
+        if current_app.config.get('SERVER_TIMING'):
+            elapsed = time.perf_counter() - timings['start']
+            response.headers['Server-Timing'] = (
+                f"db;dur={timings['sql_seconds'] * 1000:.1f};desc=\"{timings['sql_count']} queries before streaming\", "
+                f"app;dur={elapsed * 1000:.1f};desc=\"until the body started streaming\""
+            )
+        return response
+    g.pop('_timings')
+    elapsed = _record(endpoint, request.method, timings)
+    if current_app.config.get('SERVER_TIMING'):
+        response.headers['Server-Timing'] = (
+            f"db;dur={timings['sql_seconds'] * 1000:.1f};desc=\"{timings['sql_count']} queries\", "
+            f"render;dur={timings['render_seconds'] * 1000:.1f}, "
+            f"app;dur={elapsed * 1000:.1f}"
+        )
+    return response
+
+
+def _forbidden():
+    """A 403 response unless the request carries METRICS_TOKEN (when one is set)"""
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Forbidden\n', status=403, mimetype='text/plain')
+    return None
+
+
+def metrics_view():
+    forbidden = _forbidden()
+    if forbidden:
+        return forbidden
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # Under gunicorn every worker writes its samples to this directory; merge them all
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    # CONTENT_TYPE_LATEST already has a charset; mimetype= would append a second one
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def slow_queries_view():
+    """The most recent slow statements seen by the worker answering, newest first.
+
+    They contain raw SQL, so unlike /metrics this page always needs METRICS_TOKEN and
+    does not exist without one.
+    """
+    if not current_app.config.get('METRICS_TOKEN'):
+        abort(404)
+    forbidden = _forbidden()
+    if forbidden:
+        return forbidden
+    return jsonify({'pid': os.getpid(), 'threshold_seconds': current_app.config.get(
+        'SLOW_QUERY_SECONDS', DEFAULT_SLOW_QUERY_SECONDS), 'samples': list(reversed(slow_query_samples))})
+
+
+def init_metrics(app):
+    """Time every request, its SQL and its templates, and serve them at /metrics"""
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+    app.add_url_rule('/metrics/slow-queries', 'slow_queries', slow_queries_view)
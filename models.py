@@ -2,8 +2,14 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
+import hashlib
+from sqlalchemy import inspect, text
+from replicas import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+def session_version_for(password_hash):
+    return hashlib.sha256(password_hash.encode()).hexdigest()[:16]
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -18,11 +24,25 @@ class User(UserMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    @property
+    def session_version(self):
+        """Changes whenever the password does, which invalidates existing sessions"""
+        return session_version_for(self.password_hash)
+
+    def get_id(self):
+        # Stored in the session and remember-me cookie as "<id>:<session version>"
+        return f"{self.id}:{self.session_version}"
+
+def expiry_for(purchase_date, warranty_duration):
+    """Warranty expiry date for a purchase date and a duration in months"""
+    return purchase_date + timedelta(days=warranty_duration * 30)
+
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     brand = db.Column(db.String(100), nullable=False)
-    category = db.Column(db.String(50), nullable=False)
+    category = db.Column(db.String(50), nullable=False)  # the name, kept for search, exports and reports
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'))  # set on flush, see categories.py
     purchase_date = db.Column(db.Date, nullable=False)
     warranty_duration = db.Column(db.Integer, nullable=False)  # in months
     price = db.Column(db.Float, nullable=False)
@@ -32,5 +52,146 @@ class Product(db.Model):
     product_image = db.Column(db.String(200))
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    __table_args__ = (
+        # Serves the per-user dashboard aggregates and the expiry-ordered lists
+        db.Index('ix_product_user_expiry', 'user_id', 'expiry_date'),
+        # Keyset pagination of the product listing by name
+        db.Index('ix_product_user_name', 'user_id', 'name'),
+        # Ownership checks for legacy (non-blob) downloads
+        db.Index('ix_product_user_receipt_path', 'user_id', 'receipt_path'),
+        db.Index('ix_product_user_image', 'user_id', 'product_image'),
+        # Expiry reminders scan newly-due date ranges across all users
+        db.Index('ix_product_expiry_user', 'expiry_date', 'user_id'),
+        # Category filter, and the check whether a category still has products
+        db.Index('ix_product_user_category', 'user_id', 'category_id'),
+    )
+
     def calculate_expiry(self):
-        self.expiry_date = self.purchase_date + timedelta(days=self.warranty_duration * 30)
\ No newline at end of file
+        self.expiry_date = expiry_for(self.purchase_date, self.warranty_duration)
+
+class Category(db.Model):
+    """A user's product category; products reference it by id"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    name = db.Column(db.String(50), nullable=False)
+    name_key = db.Column(db.String(50), nullable=False)  # lower-cased name, for prefix lookups
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'name', name='uq_category_user_name'),
+        # Autocomplete scans a range of this index
+        db.Index('ix_category_user_key', 'user_id', 'name_key'),
+    )
+
+class UserStats(db.Model):
+    """Per-user warranty summary, kept in step with product writes.
+
+    The count/sum columns are adjusted in the same transaction as every product
+    insert, update and delete. The date-dependent buckets are only valid for
+    ``buckets_date``; a NULL ``max_value`` means it must be recomputed.
+    """
+    __tablename__ = 'user_stats'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    product_count = db.Column(db.Integer, nullable=False, default=0)
+    total_value = db.Column(db.Float, nullable=False, default=0)
+    max_value = db.Column(db.Float)
+    duration_sum = db.Column(db.Integer, nullable=False, default=0)  # months, non-zero warranties only
+    duration_count = db.Column(db.Integer, nullable=False, default=0)
+    active_count = db.Column(db.Integer, nullable=False, default=0)
+    expired_count = db.Column(db.Integer, nullable=False, default=0)
+    expiring_soon_count = db.Column(db.Integer, nullable=False, default=0)
+    buckets_date = db.Column(db.Date)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class PageVersion(db.Model):
+    """Bumped whenever a user's products change; part of every cached page's key"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class ApiToken(db.Model):
+    """A bearer token for the JSON API; only its SHA-256 is stored"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    name = db.Column(db.String(100), nullable=False)
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Blob(db.Model):
+    """An uploaded file stored once under a path derived from its SHA-256"""
+    sha256 = db.Column(db.String(64), primary_key=True)
+    path = db.Column(db.String(200), nullable=False)  # relative to UPLOAD_FOLDER
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ProductBlob(db.Model):
+    """Links a product's receipt or image to the blob holding its bytes"""
+    __tablename__ = 'product_blob'
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    kind = db.Column(db.String(10), primary_key=True)  # 'receipt' or 'image'
+    blob_sha256 = db.Column(db.String(64), db.ForeignKey('blob.sha256'), nullable=False, index=True)
+
+class Job(db.Model):
+    """A unit of background work, run by the in-process pool or `python worker.py`"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON keyword arguments
+    status = db.Column(db.String(10), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    worker = db.Column(db.String(100))
+    error = db.Column(db.Text)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))  # who may poll its status
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Workers claim the oldest runnable job
+        db.Index('ix_job_status_run_after', 'status', 'run_after'),
+    )
+
+class ReminderWatermark(db.Model):
+    """Highest expiry date already reminded about for one reminder window"""
+    __tablename__ = 'reminder_watermark'
+    window_days = db.Column(db.Integer, primary_key=True)
+    through_date = db.Column(db.Date, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class Notification(db.Model):
+    """An outgoing message, written by the reminder scheduler and drained by the sender"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime)  # when a sender marked it sending; see SEND_LEASE_SECONDS
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_notification_status', 'status', 'id'),
+    )
+
+def create_missing_columns():
+    """Add nullable model columns that an existing database's tables are missing"""
+    inspector = inspect(db.engine)
+    quote = db.engine.dialect.identifier_preparer.quote
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable and not column.foreign_keys:
+                with db.engine.begin() as conn:
+                    conn.execute(text(f'ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} '
+                                      f'{column.type.compile(dialect=db.engine.dialect)}'))
+
+def create_missing_indexes():
+    """Create indexes declared on the models that an existing database is missing"""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
@@ -0,0 +1,222 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from functools import wraps
+from flask import Response, current_app, make_response, request, session
+from flask_login import current_user
+from sqlalchemy import event, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+from assets import DIST_DIR, MANIFEST
+from metrics import PAGE_CACHE_REQUESTS
+from models import db, Product, PageVersion
+
+# Pages with flashed messages consume them when rendered, so they are never cached
+FLASHES_KEY = '_flashes'
+
+
+class MemoryPageCache:
+    """Least-recently-used pages, private to one worker process, bounded by count and total size"""
+
+    def __init__(self, max_entries=1000, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def set(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = body
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+
+class SQLitePageCache:
+    """Pages in a local SQLite file shared by every worker on the machine"""
+
+    # Trim back to max_entries after this many writes rather than on every one
+    PRUNE_EVERY = 100
+
+    # A hit refreshes used_at only if it is older than this, so hot pages are read without writing
+    TOUCH_SECONDS = 60
+
+    def __init__(self, path, max_entries=1000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        with self._connection() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS page (key TEXT PRIMARY KEY, body BLOB NOT NULL, '
+                         'used_at REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_page_used_at ON page (used_at)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')  # losing cached pages in a crash is harmless
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connection()
+        row = conn.execute('SELECT body, used_at FROM page WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[1] > self.TOUCH_SECONDS:
+            conn.execute('UPDATE page SET used_at = ? WHERE key = ?', (now, key))
+        return row[0]
+
+    def set(self, key, body):
+        conn = self._connection()
+        conn.execute('INSERT OR REPLACE INTO page (key, body, used_at) VALUES (?, ?, ?)', (key, body, time.time()))
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            conn.execute('DELETE FROM page WHERE key NOT IN (SELECT key FROM page ORDER BY used_at DESC LIMIT ?)',
+                         (self.max_entries,))
+
+
+def create_page_cache(config):
+    """Build the backend named by PAGE_CACHE ('memory', 'sqlite' or 'none')"""
+    backend = config.get('PAGE_CACHE', 'memory')
+    max_entries = config.get('PAGE_CACHE_SIZE', 1000)
+    if backend == 'memory':
+        return MemoryPageCache(max_entries, config.get('PAGE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    if backend == 'sqlite':
+        return SQLitePageCache(config['PAGE_CACHE_PATH'], max_entries)
+    if backend == 'none':
+        return None
+    raise ValueError(f'Unknown PAGE_CACHE backend: {backend}')
+
+
+def _template_fingerprint(app):
+    """Changes when a deploy changes any template or the asset bundle, so browsers do not keep old markup"""
+    digest = hashlib.sha256()
+    template_dir = os.path.join(app.root_path, app.template_folder)
+    paths = [os.path.join(root, name) for root, _, files in os.walk(template_dir) for name in files]
+    paths.append(os.path.join(app.static_folder, DIST_DIR, MANIFEST))
+    for path in sorted(paths):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f'{path}:{stat.st_mtime_ns}:{stat.st_size};'.encode())
+    return digest.hexdigest()[:16]
+
+
+def init_page_cache(app):
+    app.extensions['page_cache'] = create_page_cache(app.config)
+    app.extensions['page_cache_build'] = app.config.get('BUILD_ID') or _template_fingerprint(app)
+
+
+def data_version(user_id):
+    """The user's current data version, creating their row on first use"""
+    version = db.session.scalar(select(PageVersion.version).where(PageVersion.user_id == user_id))
+    if version is not None:
+        return version
+    db.session.add(PageVersion(user_id=user_id, version=0))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker created the row first
+        db.session.rollback()
+    return db.session.scalar(select(PageVersion.version).where(PageVersion.user_id == user_id))
+
+
+def bump_data_version(user_ids, connection=None):
+    """Invalidate every cached page of these users, in the caller's transaction"""
+    user_ids = sorted(set(user_ids))
+    if user_ids:
+        (connection or db.session.connection()).execute(
+            update(PageVersion).where(PageVersion.user_id.in_(user_ids)).values(version=PageVersion.version + 1))
+
+
+def _page_key(version):
+    args = '&'.join(f'{name}={value}' for name, value in sorted(request.args.items(multi=True)))
+    parts = (current_app.extensions['page_cache_build'], current_user.get_id(), current_user.email,
+             request.endpoint, args, version, date.today().isoformat())
+    return hashlib.sha256('|'.join(str(part) for part in parts).encode()).hexdigest()[:32]
+
+
+def _tee(chunks, store):
+    """Pass a streamed body through, storing it once it has been sent in full"""
+    sent = []
+    for chunk in chunks:
+        sent.append(chunk if isinstance(chunk, bytes) else chunk.encode())
+        yield chunk
+    store(b''.join(sent))
+
+
+def cached_page(view):
+    """Serve a logged-in GET view from the page cache, with an ETag and 304 revalidation.
+
+    A page is keyed by user, route, query arguments, the user's data version and
+    today's date (expiry buckets roll over at midnight). The view itself only
+    runs on a cache miss.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        cache = current_app.extensions.get('page_cache')
+        if cache is None or request.method != 'GET' or FLASHES_KEY in session:
+            return view(*args, **kwargs)
+        etag = _page_key(data_version(current_user.id))
+        if request.if_none_match.contains_weak(etag):
+            PAGE_CACHE_REQUESTS.labels('not_modified').inc()
+            response = Response(status=304)
+        else:
+            body = cache.get(etag)
+            if body is None:
+                PAGE_CACHE_REQUESTS.labels('miss').inc()
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                if response.is_streamed:
+                    response.response = _tee(response.response, lambda body: cache.set(etag, body))
+                else:
+                    cache.set(etag, response.get_data())
+            else:
+                PAGE_CACHE_REQUESTS.labels('hit').inc()
+                response = Response(body, mimetype='text/html')
+        response.set_etag(etag)
+        # Browsers may keep the page but must check it is current; shared caches may not keep it
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return wrapper
+
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_changed_users(session, flush_context, instances):
+    users = session.info.setdefault('page_version_users', set())
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, Product):
+            users.add(obj.user_id)
+    for obj in session.dirty:
+        if isinstance(obj, Product) and session.is_modified(obj):
+            users.add(obj.user_id)
+            # A product moved to another user changes both users' pages
+            users.update(inspect(obj).attrs.user_id.history.deleted)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _bump_changed_users(session, flush_context):
+    users = session.info.pop('page_version_users', None)
+    if users:
+        bump_data_version(users, session.connection())
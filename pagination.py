@@ -0,0 +1,113 @@
+from datetime import date
+from flask import current_app
+from itsdangerous import URLSafeSerializer, BadSignature
+from sqlalchemy import tuple_
+from models import Product
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+# Sort key -> (label, column, descending); ties are always broken by Product.id
+SORT_ORDERS = {
+    'expiry': ('Expiry date (soonest first)', Product.expiry_date, False),
+    'expiry_desc': ('Expiry date (latest first)', Product.expiry_date, True),
+    'name': ('Name (A-Z)', Product.name, False),
+    'recent': ('Recently added', None, True),
+}
+DEFAULT_SORT = 'expiry'
+
+# Only available when a search supplies a rank expression (lower ranks first)
+RELEVANCE_SORT = 'relevance'
+
+
+class Page:
+    def __init__(self, items, sort, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.sort = sort
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='products-cursor')
+
+
+def _key(product, column, value=None):
+    if column is None:
+        return [product.id]
+    if value is None:
+        value = getattr(product, column.key)
+    return [value.isoformat() if isinstance(value, date) else value, product.id]
+
+
+def encode_cursor(sort, direction, key):
+    return _serializer().dumps([sort, direction, key])
+
+
+def decode_cursor(cursor, sort):
+    """Return (direction, key) for a cursor, or (None, None) if it is invalid or for another sort"""
+    try:
+        cursor_sort, direction, key = _serializer().loads(cursor)
+    except (BadSignature, ValueError, TypeError):
+        return None, None
+    if cursor_sort != sort or direction not in ('next', 'prev'):
+        return None, None
+    column = SORT_ORDERS[sort][1] if sort in SORT_ORDERS else None
+    if column is not None and column.key.endswith('_date'):
+        key[0] = date.fromisoformat(key[0])
+    return direction, key
+
+
+def page_size(value):
+    try:
+        return max(1, min(int(value), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+
+
+def paginate(query, sort=DEFAULT_SORT, cursor=None, per_page=DEFAULT_PAGE_SIZE, rank=None):
+    """Keyset-paginate a Product query.
+
+    Rows are ordered by (sort column, id) and each page seeks past the edge row
+    of the previous one, so every page costs the same as the first. Passing a
+    search ``rank`` expression enables the relevance sort.
+    """
+    ranked = sort == RELEVANCE_SORT and rank is not None
+    if ranked:
+        column, descending = rank, False
+        query = query.add_columns(rank)
+    else:
+        if sort not in SORT_ORDERS:
+            sort = DEFAULT_SORT
+        _, column, descending = SORT_ORDERS[sort]
+    columns = [Product.id] if column is None else [column, Product.id]
+    direction, key = decode_cursor(cursor, sort) if cursor else (None, None)
+
+    # Walking backwards flips the comparison and the ordering, then the page is reversed
+    backwards = direction == 'prev'
+    reverse = descending != backwards
+    if key is not None:
+        edge = tuple_(*columns) if len(columns) > 1 else columns[0]
+        bound = tuple_(*key) if len(key) > 1 else key[0]
+        query = query.filter(edge < bound if reverse else edge > bound)
+    query = query.order_by(*[c.desc() if reverse else c.asc() for c in columns])
+
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    if ranked:
+        keys = [_key(product, column, value) for product, value in rows]
+        rows = [product for product, _ in rows]
+    else:
+        keys = [_key(product, column) for product in rows]
+
+    has_next = has_more if not backwards else True
+    has_prev = has_more if backwards else key is not None
+    return Page(
+        rows, sort, per_page,
+        next_cursor=encode_cursor(sort, 'next', keys[-1]) if rows and has_next else None,
+        prev_cursor=encode_cursor(sort, 'prev', keys[0]) if rows and has_prev else None,
+    )
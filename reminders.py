@@ -0,0 +1,203 @@
+import smtplib
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from email.message import EmailMessage
+from flask import current_app
+from sqlalchemy import select, update, insert
+from sqlalchemy.exc import IntegrityError
+from models import db, User, Product, ReminderWatermark, Notification
+from jobs import handler, enqueue
+
+# Days before expiry at which a reminder is sent
+REMINDER_WINDOWS = (30, 7, 1)
+
+# Rows fetched per round trip while scanning newly-due products
+SCAN_BATCH_SIZE = 5000
+
+# Notifications claimed per batch by the sender, and attempts before giving up
+SEND_BATCH_SIZE = 100
+MAX_SEND_ATTEMPTS = 5
+
+# A notification left sending this long is assumed lost with its sender and is retried.
+# Delivery is at least once: a sender that died after the SMTP handoff sends it again
+SEND_LEASE_SECONDS = 15 * 60
+
+
+def _advance_watermark(days, previous, through):
+    """Move a window's watermark from ``previous`` to ``through``; False if another run got there first"""
+    if previous is None:
+        db.session.add(ReminderWatermark(window_days=days, through_date=through))
+        try:
+            db.session.flush()
+        except IntegrityError:
+            return False
+        return True
+    result = db.session.execute(
+        update(ReminderWatermark)
+        .where(ReminderWatermark.window_days == days, ReminderWatermark.through_date == previous)
+        .values(through_date=through, updated_at=datetime.utcnow())
+    )
+    return result.rowcount == 1
+
+
+def _due_products(lower, upper):
+    """Products expiring between two dates, read through the (expiry_date, user_id) index"""
+    return db.session.execute(
+        select(Product.user_id, User.email, Product.name, Product.brand, Product.expiry_date, Product.id)
+        .join(User, User.id == Product.user_id)
+        .where(Product.expiry_date.between(lower, upper))
+        .execution_options(yield_per=SCAN_BATCH_SIZE)
+    )
+
+
+def _message(products, today):
+    count = len(products)
+    subject = f"{count} warranty expires soon" if count == 1 else f"{count} warranties expire soon"
+    lines = ["These warranties are about to expire:", ""]
+    for row in sorted(products, key=lambda row: (row.expiry_date, row.name)):
+        days = (row.expiry_date - today).days
+        when = 'today' if days == 0 else f"in {days} day{'s' if days != 1 else ''}"
+        lines.append(f"- {row.name} ({row.brand}) expires on {row.expiry_date:%d %b %Y}, {when}")
+    return subject, '\n'.join(lines) + '\n'
+
+
+def schedule_reminders(today=None):
+    """Queue one notification per user for products that entered a reminder window.
+
+    Each window keeps a watermark of the last expiry date it covered, so a run
+    only reads the expiry dates that became due since the previous run (a
+    single day when run daily). The first run for a window starts from today
+    rather than backfilling. Returns (products, notifications).
+    """
+    today = today or date.today()
+    watermarks = {row.window_days: row.through_date for row in ReminderWatermark.query}
+    due = {}
+    # Largest window first, so a product caught up in several windows at once
+    # is reported against the nearest one
+    for days in sorted(REMINDER_WINDOWS, reverse=True):
+        through = today + timedelta(days=days)
+        previous = watermarks.get(days)
+        if previous is not None and previous >= through:
+            continue
+        if not _advance_watermark(days, previous, through):
+            db.session.rollback()
+            return 0, 0
+        lower = through if previous is None else max(previous + timedelta(days=1), today)
+        for row in _due_products(lower, through):
+            due[row.id] = row
+
+    by_user = defaultdict(list)
+    for row in due.values():
+        by_user[row.user_id].append(row)
+    notifications = []
+    now = datetime.utcnow()
+    for user_id, products in by_user.items():
+        subject, body = _message(products, today)
+        notifications.append({'user_id': user_id, 'recipient': products[0].email, 'subject': subject,
+                              'body': body, 'status': 'pending', 'attempts': 0, 'created_at': now})
+    if notifications:
+        db.session.execute(insert(Notification), notifications)
+        enqueue('send-notifications')
+    # The outbox rows and the watermark move commit together
+    db.session.commit()
+    return len(due), len(notifications)
+
+
+@contextmanager
+def open_transport(config):
+    """Yield a callable that delivers an EmailMessage over the configured transport"""
+    transport = config['NOTIFICATION_TRANSPORT']
+    if transport == 'smtp':
+        server_class = smtplib.SMTP_SSL if config['MAIL_USE_SSL'] else smtplib.SMTP
+        server = server_class(config['MAIL_SERVER'], config['MAIL_PORT'], timeout=30)
+        try:
+            if config['MAIL_USE_TLS']:
+                server.starttls()
+            if config['MAIL_USERNAME']:
+                server.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+            yield server.send_message
+        finally:
+            server.quit()
+    elif transport == 'file':
+        with open(config['NOTIFICATION_FILE'], 'a', encoding='utf-8') as out:
+            yield lambda message: out.write(message.as_string() + '\n')
+    else:
+        yield lambda message: print(message.as_string())
+
+
+def _email(notification, sender):
+    message = EmailMessage()
+    message['From'] = sender
+    message['To'] = notification.recipient
+    message['Subject'] = notification.subject
+    message.set_content(notification.body)
+    return message
+
+
+def _sendable(now):
+    stale = now - timedelta(seconds=SEND_LEASE_SECONDS)
+    return (Notification.status == 'pending') | (
+        (Notification.status == 'sending') & (Notification.claimed_at < stale) &
+        (Notification.attempts < MAX_SEND_ATTEMPTS))
+
+
+def _fail_abandoned(now):
+    """Give up on notifications whose senders died on their final attempt"""
+    db.session.execute(
+        update(Notification).where(
+            Notification.status == 'sending', Notification.claimed_at < now - timedelta(seconds=SEND_LEASE_SECONDS),
+            Notification.attempts >= MAX_SEND_ATTEMPTS)
+        .values(status='failed', error='sender did not finish'))
+    db.session.commit()
+
+
+def _claim(after_id):
+    """Mark the next batch of pending (or abandoned) notifications as sending; returns the ones this sender won"""
+    now = datetime.utcnow()
+    ids = db.session.scalars(
+        select(Notification.id).where(_sendable(now), Notification.id > after_id)
+        .order_by(Notification.id).limit(SEND_BATCH_SIZE)
+    ).all()
+    if not ids:
+        return [], None
+    claimed = db.session.scalars(
+        update(Notification).where(Notification.id.in_(ids), _sendable(now))
+        .values(status='sending', claimed_at=now, attempts=Notification.attempts + 1).returning(Notification.id)
+    ).all()
+    db.session.commit()
+    return Notification.query.filter(Notification.id.in_(claimed)).order_by(Notification.id).all(), ids[-1]
+
+
+@handler('send-notifications')
+def send_notifications():
+    """Deliver pending outbox notifications in batches over one transport connection.
+
+    A notification is marked sending before delivery, so concurrent senders never
+    deliver it twice; one still sending after SEND_LEASE_SECONDS is taken over.
+    Returns (sent, failed).
+    """
+    config = current_app.config
+    sent = failed = 0
+    last_id = 0
+    _fail_abandoned(datetime.utcnow())
+    with open_transport(config) as deliver:
+        while True:
+            batch, last_id = _claim(last_id)
+            if last_id is None:
+                break
+            for notification in batch:
+                try:
+                    deliver(_email(notification, config['MAIL_FROM']))
+                except (smtplib.SMTPException, OSError) as e:
+                    notification.error = str(e)
+                    notification.status = 'failed' if notification.attempts >= MAX_SEND_ATTEMPTS else 'pending'
+                    failed += 1
+                else:
+                    notification.status = 'sent'
+                    notification.sent_at = datetime.utcnow()
+                    notification.error = None
+                    sent += 1
+            db.session.commit()
+    return sent, failed
+
@@ -0,0 +1,113 @@
+import random
+import time
+from flask import current_app, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy.exc import SQLAlchemyError
+from metrics import DATABASE_ROUTES
+
+# Bind keys of the replica engines in SQLALCHEMY_BINDS (see config.py) start with this
+REPLICA_PREFIX = 'replica'
+
+# Flask session key holding when the user last wrote, for read-your-writes
+LAST_WRITE_KEY = '_db_write_at'
+
+READ_METHODS = ('GET', 'HEAD')
+
+# Replica bind key -> time before which it is not tried again, per process
+_down_until = {}
+
+# Replica bind key -> time until which its last successful probe is trusted, per process
+_healthy_until = {}
+
+
+def _is_write(clause):
+    return clause is None or getattr(clause, 'is_dml', False) or getattr(clause, '_for_update_arg', None) is not None
+
+
+class RoutingSession(Session):
+    """Send the reads of a request to the replica chosen for it, and everything else to the primary.
+
+    Once the session has written, the rest of the request reads from the primary too, so a
+    view never reads back a replica that has not yet received its own write.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and (self._flushing or _is_write(clause)):
+            self.info['wrote'] = True
+        replica = self.info.get('replica')
+        if bind is None and replica is not None and not self.info.get('wrote'):
+            return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def use_primary(session):
+    """Send the rest of the session's reads to the primary, before reading data it will write back"""
+    session.info['wrote'] = True
+
+
+def _replica_keys(db):
+    return [key for key in db.engines if isinstance(key, str) and key.startswith(REPLICA_PREFIX)]
+
+
+def _healthy_replica(db, keys):
+    """A replica engine that accepts a connection, skipping replicas that failed recently.
+
+    A replica is probed at most once per REPLICA_HEALTH_SECONDS; in between, a replica that
+    answered its last probe is used without opening a connection first.
+    """
+    now = time.monotonic()
+    keys = [key for key in keys if _down_until.get(key, 0) <= now]
+    random.shuffle(keys)
+    for key in keys:
+        engine = db.engines[key]
+        if _healthy_until.get(key, 0) > now:
+            return engine
+        try:
+            # A pooled checkout; with pool_pre_ping this also proves the server answers
+            engine.connect().close()
+        except SQLAlchemyError:
+            current_app.logger.warning('read replica %s is unavailable; using the primary', key)
+            _down_until[key] = now + current_app.config['REPLICA_RETRY_SECONDS']
+            _healthy_until.pop(key, None)
+            continue
+        _healthy_until[key] = now + current_app.config['REPLICA_HEALTH_SECONDS']
+        return engine
+    return None
+
+
+def _route_request():
+    from models import db
+    keys = _replica_keys(db)
+    if not keys:
+        return
+    if request.method not in READ_METHODS:
+        DATABASE_ROUTES.labels('primary').inc()
+        return
+    wrote_at = session.get(LAST_WRITE_KEY)
+    if wrote_at and time.time() - wrote_at < current_app.config['REPLICA_STICKY_SECONDS']:
+        DATABASE_ROUTES.labels('sticky').inc()
+        return
+    engine = _healthy_replica(db, keys)
+    if engine is None:
+        DATABASE_ROUTES.labels('fallback').inc()
+        return
+    db.session.info['replica'] = engine
+    DATABASE_ROUTES.labels('replica').inc()
+
+
+def _remember_write(response):
+    from models import db
+    if _replica_keys(db) and db.session.info.get('wrote'):
+        session[LAST_WRITE_KEY] = time.time()
+    return response
+
+
+def init_replicas(app):
+    """Route GET/HEAD requests to a read replica when SQLALCHEMY_BINDS has any.
+
+    After a user writes, their requests stay on the primary for REPLICA_STICKY_SECONDS so
+    they see their own changes; a replica that cannot be reached is skipped for
+    REPLICA_RETRY_SECONDS. CLI commands and jobs always use the primary.
+    """
+    app.before_request(_route_request)
+    app.after_request(_remember_write)
@@ -0,0 +1,185 @@
+import glob
+import json
+import os
+from datetime import date, timedelta
+from xml.sax.saxutils import escape
+from flask import current_app
+from sqlalchemy import select
+from jobs import enqueue, handler
+from models import db, Job, Product, User
+from page_cache import data_version
+from stats import EXPIRING_SOON_DAYS, user_stats
+
+# Products per table; a table is the unit that is built, laid out and dropped
+REPORT_TABLE_ROWS = 40
+
+# Rows fetched from the database per round trip
+REPORT_BATCH_SIZE = 1000
+
+# Flowables kept queued ahead of the layout engine
+LOOKAHEAD = 8
+
+REPORTS_DIR = 'reports'
+
+
+def report_path(user_id, version, today):
+    """Where the report for one data version and day is cached"""
+    return os.path.join(current_app.config['INSTANCE_PATH'], REPORTS_DIR,
+                        f"portfolio-{user_id}-{version}-{today.isoformat()}.pdf")
+
+
+def _status(expiry, today):
+    if expiry < today:
+        return 'Expired'
+    if expiry <= today + timedelta(days=EXPIRING_SOON_DAYS):
+        return 'Expiring soon'
+    return 'Active'
+
+
+def _money(value):
+    # The standard PDF fonts have no rupee sign
+    return f"Rs. {value:,.2f}"
+
+
+class _LazyFlowables(list):
+    """A flowable list that the layout engine drains while a generator refills it.
+
+    reportlab's build() loops on len() and pops from the front, so topping the
+    list up in __len__ keeps only a few tables in memory however many products
+    there are.
+    """
+
+    def __init__(self, flowables):
+        super().__init__()
+        self._source = iter(flowables)
+
+    def __len__(self):
+        while self._source is not None and super().__len__() < LOOKAHEAD:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
+        return super().__len__()
+
+
+def _product_rows(user_id):
+    stmt = select(Product.category, Product.name, Product.brand, Product.purchase_date, Product.expiry_date,
+                  Product.price).where(Product.user_id == user_id).order_by(
+        Product.category, Product.expiry_date, Product.id).execution_options(yield_per=REPORT_BATCH_SIZE)
+    result = db.session.execute(stmt)
+    try:
+        for partition in result.partitions():
+            yield from partition
+    finally:
+        result.close()
+
+
+def _flowables(user, today):
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import Paragraph, Spacer, Table, TableStyle
+
+    styles = getSampleStyleSheet()
+    header = ['Name', 'Brand', 'Purchased', 'Expires', 'Status', 'Price']
+    table_style = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('ALIGN', (5, 0), (5, -1), 'RIGHT'),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f1f5f9')]),
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.HexColor('#cbd5e1')),
+    ])
+    widths = [150, 90, 60, 60, 70, 80]
+
+    def table(rows):
+        result = Table([header] + rows, colWidths=widths, repeatRows=1)
+        result.setStyle(table_style)
+        return result
+
+    def category_total(category, count, value):
+        return Paragraph(f"<b>{escape(category)}</b>: {count} products, {_money(value)}", styles['Normal'])
+
+    stats = user_stats(user.id, today)
+    yield Paragraph('Warranty Portfolio', styles['Title'])
+    yield Paragraph(f"{escape(user.email)} &middot; generated {today.strftime('%d %B %Y')}", styles['Normal'])
+    yield Spacer(1, 12)
+    yield Paragraph(
+        f"{stats['total_products']} products worth {_money(stats['total_value'])}: "
+        f"{stats['active_products']} active, {stats['expiring_soon']} expiring within {EXPIRING_SOON_DAYS} days, "
+        f"{stats['expired_products']} expired.", styles['Normal'])
+    yield Spacer(1, 12)
+
+    category, rows, count, value = None, [], 0, 0.0
+    for row in _product_rows(user.id):
+        if row.category != category:
+            if rows:
+                yield table(rows)
+            if category is not None:
+                yield category_total(category, count, value)
+                yield Spacer(1, 12)
+            category, rows, count, value = row.category, [], 0, 0.0
+            heading = Paragraph(escape(category), styles['Heading2'])
+            heading.keepWithNext = True
+            yield heading
+        rows.append([row.name[:40], row.brand[:20], row.purchase_date.isoformat(), row.expiry_date.isoformat(),
+                     _status(row.expiry_date, today), _money(row.price)])
+        count += 1
+        value += row.price
+        if len(rows) == REPORT_TABLE_ROWS:
+            yield table(rows)
+            rows = []
+    if rows:
+        yield table(rows)
+    if category is not None:
+        yield category_total(category, count, value)
+    else:
+        yield Paragraph('No products yet.', styles['Normal'])
+
+
+def _page_number(canvas, doc):
+    canvas.saveState()
+    canvas.setFont('Helvetica', 8)
+    canvas.drawRightString(doc.pagesize[0] - doc.rightMargin, 20, f"Page {doc.page}")
+    canvas.restoreState()
+
+
+@handler('portfolio-report')
+def build_portfolio_report(owner_id, version, today):
+    """Render a user's portfolio PDF for a data version, replacing their older reports.
+
+    The owner is passed as owner_id because enqueue() keeps user_id for the job itself.
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate
+
+    today = date.fromisoformat(today)
+    path = report_path(owner_id, version, today)
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    user = db.session.get(User, owner_id)
+    partial = f"{path}.{os.getpid()}.part"
+    doc = SimpleDocTemplate(partial, pagesize=A4, title='Warranty Portfolio', author='Digital Warranty')
+    doc.build(_LazyFlowables(_flowables(user, today)), onFirstPage=_page_number, onLaterPages=_page_number)
+    os.replace(partial, path)
+    for old in glob.glob(os.path.join(os.path.dirname(path), f"portfolio-{owner_id}-*.pdf")):
+        if old != path:
+            os.remove(old)
+    return path
+
+
+def portfolio_report(user_id):
+    """Return (path, None) when the current report is ready, else (None, job) for its pending build"""
+    version = data_version(user_id)
+    today = date.today()
+    path = report_path(user_id, version, today)
+    if os.path.exists(path):
+        return path, None
+    payload = {'owner_id': user_id, 'version': version, 'today': today.isoformat()}
+    job = Job.query.filter(Job.kind == 'portfolio-report', Job.user_id == user_id,
+                           Job.status.in_(('queued', 'running')), Job.payload == json.dumps(payload)).first()
+    if job is None:
+        job = enqueue('portfolio-report', user_id=user_id, **payload)
+        db.session.commit()
+    return None, job
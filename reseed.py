@@ -5,11 +5,14 @@ Run this with: python reseed.py
 
 import os
 import sys
-from app import app, db
+from app import create_app, db
 from models import User, Product
 from seed import seed_db
+from search import init_search
+from jobs import drain
 
 if __name__ == '__main__':
+    app = create_app()
     with app.app_context():
         print("Clearing existing data...")
         # Drop all tables
@@ -18,10 +21,12 @@ if __name__ == '__main__':
         
         # Recreate tables
         db.create_all()
+        init_search()
         print("✓ Tables created")
         
         # Seed with new data
         seed_db()
+        drain(app)
         print("✓ Database reseeded with product-named image files")
         
         # Show what was created
@@ -0,0 +1,137 @@
+import re
+from sqlalchemy import Double, cast, text, literal_column, select, func
+from models import db, Product
+
+# bm25 weights given to name, brand and category matches when ranking results
+NAME_WEIGHT, BRAND_WEIGHT, CATEGORY_WEIGHT = 10.0, 5.0, 2.0
+
+# The index keeps its own copy of the searchable text plus an "owner" token
+# (u<user_id>), so a search intersects with one user's rows inside the index
+# instead of matching every user's products and filtering afterwards
+SQLITE_TABLE = """CREATE VIRTUAL TABLE product_fts USING fts5(
+    name, brand, category, owner,
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+)"""
+
+SQLITE_TRIGGERS = {
+    'product_fts_insert': """CREATE TRIGGER product_fts_insert AFTER INSERT ON product BEGIN
+        INSERT INTO product_fts(rowid, name, brand, category, owner)
+        VALUES (new.id, new.name, new.brand, new.category, 'u' || new.user_id);
+    END""",
+    'product_fts_delete': """CREATE TRIGGER product_fts_delete AFTER DELETE ON product BEGIN
+        DELETE FROM product_fts WHERE rowid = old.id;
+    END""",
+    'product_fts_update': """CREATE TRIGGER product_fts_update AFTER UPDATE OF name, brand, category, user_id ON product BEGIN
+        DELETE FROM product_fts WHERE rowid = old.id;
+        INSERT INTO product_fts(rowid, name, brand, category, owner)
+        VALUES (new.id, new.name, new.brand, new.category, 'u' || new.user_id);
+    END""",
+}
+
+SQLITE_REBUILD = [
+    "DELETE FROM product_fts",
+    """INSERT INTO product_fts(rowid, name, brand, category, owner)
+       SELECT id, name, brand, category, 'u' || user_id FROM product""",
+]
+
+POSTGRES_SCHEMA = [
+    # A generated column is recomputed by PostgreSQL on every insert and update
+    """ALTER TABLE product ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(brand, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(category, '')), 'C')
+    ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_product_search_vector ON product USING GIN (search_vector)",
+]
+
+# Backend detected per engine, so searches do not re-inspect the schema
+_backends = {}
+
+
+def _sqlite_objects(conn):
+    return {row[0] for row in conn.execute(text(
+        "SELECT name FROM sqlite_master WHERE name = 'product_fts' OR name LIKE 'product_fts_%'"))}
+
+
+def backend():
+    """Name of the full-text backend for the current database, or None for the LIKE fallback"""
+    engine = db.engine
+    if engine not in _backends:
+        name = None
+        if engine.dialect.name == 'postgresql':
+            name = 'postgresql'
+        elif engine.dialect.name == 'sqlite':
+            with engine.connect() as conn:
+                if {'product_fts', *SQLITE_TRIGGERS} <= _sqlite_objects(conn):
+                    name = 'sqlite'
+        _backends[engine] = name
+    return _backends[engine]
+
+
+def init_search():
+    """Create the full-text index and the machinery that keeps it in sync with product"""
+    engine = db.engine
+    _backends.pop(engine, None)
+    if engine.dialect.name == 'postgresql':
+        with engine.begin() as conn:
+            for statement in POSTGRES_SCHEMA:
+                conn.execute(text(statement))
+    elif engine.dialect.name == 'sqlite':
+        with engine.begin() as conn:
+            existing = _sqlite_objects(conn)
+            if 'product_fts' not in existing:
+                conn.execute(text(SQLITE_TABLE))
+            missing = [name for name in SQLITE_TRIGGERS if name not in existing]
+            for name in missing:
+                conn.execute(text(SQLITE_TRIGGERS[name]))
+            # Writes made while the index or a trigger was missing are not indexed yet
+            if missing:
+                for statement in SQLITE_REBUILD:
+                    conn.execute(text(statement))
+
+
+def rebuild_search():
+    """Rebuild the full-text index from the product table"""
+    if backend() == 'sqlite':
+        with db.engine.begin() as conn:
+            for statement in SQLITE_REBUILD:
+                conn.execute(text(statement))
+
+
+def _terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def apply_search(base_query, query, user_id):
+    """Restrict a user's Product query to rows matching a search string.
+
+    Every word must match the start of a word in the name, brand or category.
+    Returns (query, rank) where rank orders best matches first when ascending;
+    rank is None when the LIKE fallback is used.
+    """
+    terms = _terms(query)
+    engine = backend() if terms else None
+
+    if engine == 'sqlite':
+        words = ' '.join('"%s"*' % term.replace('"', '""') for term in terms)
+        match = f'owner:u{int(user_id)} AND {{name brand category}}: ({words})'
+        hits = select(
+            literal_column('product_fts.rowid').label('id'),
+            literal_column(f'bm25(product_fts, {NAME_WEIGHT}, {BRAND_WEIGHT}, {CATEGORY_WEIGHT}, 0.0)').label('rank'),
+        ).select_from(text('product_fts')).where(
+            text('product_fts MATCH :match').bindparams(match=match)
+        ).subquery('search_hits')
+        return base_query.join(hits, hits.c.id == Product.id), hits.c.rank
+
+    if engine == 'postgresql':
+        tsquery = func.to_tsquery('simple', ' & '.join(f'{term}:*' for term in terms))
+        vector = literal_column('product.search_vector')
+        # ts_rank weighs the A/B/C labels on name/brand/category; negate so best comes first.
+        # It returns float4: cast to float8 so the value a cursor carries (a Python float)
+        # compares equal to the row it came from
+        rank = -cast(func.ts_rank(vector, tsquery), Double)
+        return base_query.filter(vector.op('@@')(tsquery)), rank
+
+    return base_query.filter(
+        Product.name.contains(query) | Product.brand.contains(query) | Product.category.contains(query)
+    ), None
@@ -1,14 +1,23 @@
-from models import db, User, Product
-from datetime import datetime
+from models import db, User, Product, expiry_for
+from datetime import datetime, date, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import func, select, text
+from werkzeug.security import generate_password_hash
+import itertools
+import math
 import os
-from PIL import Image, ImageDraw, ImageFont
 import random
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+import time
+from jobs import handler, enqueue
+from categories import category_ids
 
+# Pillow and reportlab are imported inside the job handlers that draw files,
+# so importing this module (and the app) stays cheap
+
+@handler('placeholder-image')
 def create_placeholder_image(text, filename, category=None):
+    from PIL import Image, ImageDraw, ImageFont
+
     # Create different types of placeholder images based on category
     colors = {
         'Electronics': ('#E8F4FD', '#1E88E5'),  # Light blue, blue
@@ -86,8 +95,13 @@ def create_placeholder_image(text, filename, category=None):
 
     img.save(filename)
 
+@handler('receipt-pdf')
 def create_receipt_pdf(filename, receipt_data):
     """Create a PDF receipt with the given data"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+
     doc = SimpleDocTemplate(filename, pagesize=letter)
     styles = getSampleStyleSheet()
     story = []
@@ -138,7 +152,7 @@ def seed_db():
             user = User(email=user_data['email'])
             user.set_password(user_data['password'])
             db.session.add(user)
-            db.session.commit()  # Commit each user to get id
+            db.session.flush()  # Assigns the id; everything commits together below
         users.append(user)
 
     # Sample products
@@ -314,7 +328,8 @@ def seed_db():
         product_name_sanitized = prod_data['name'].lower().replace(' ', '_').replace("'", '')
         image_filename = f"{user.id}_{product_name_sanitized}.png"
         image_path = os.path.join('static', 'uploads', image_filename)
-        create_placeholder_image(prod_data['name'], image_path, prod_data['category'])
+        # Drawing the image and PDF is left to the job workers
+        enqueue('placeholder-image', text=prod_data['name'], filename=image_path, category=prod_data['category'])
         product.product_image = image_filename
 
         # Create receipt PDF
@@ -332,9 +347,153 @@ def seed_db():
             'warranty_months': prod_data['warranty_duration']
         }
 
-        create_receipt_pdf(receipt_path, receipt_data)
+        enqueue('receipt-pdf', filename=receipt_path, receipt_data=receipt_data)
         product.receipt_path = receipt_filename
 
         db.session.add(product)
     db.session.commit()
-    print("Database seeded with sample data.")
\ No newline at end of file
+    print("Database seeded with sample data.")
+
+# Synthetic data for load testing: category -> (weight, brands, item names, price range in INR)
+SYNTHETIC_CATEGORIES = {
+    'Electronics': (30, ['Apple', 'Samsung', 'Sony', 'LG', 'Dell', 'Lenovo', 'JBL', 'OnePlus'],
+                    ['Phone', 'Laptop', 'Headphones', 'Television', 'Tablet', 'Speaker', 'Monitor'], (1500, 250000)),
+    'Kitchen Appliances': (20, ['Philips', 'Bosch', 'Prestige', 'Keurig', 'Instant Pot', 'Whirlpool'],
+                           ['Mixer', 'Microwave', 'Refrigerator', 'Coffee Maker', 'Kettle', 'Dishwasher'], (800, 150000)),
+    'Furniture': (15, ['IKEA', 'Herman Miller', 'Godrej', 'Urban Ladder'],
+                  ['Office Chair', 'Dining Table', 'Sofa', 'Bookshelf', 'Bed Frame'], (2000, 200000)),
+    'Clothing': (15, ['Nike', "Levi's", 'Adidas', 'Puma', 'Uniqlo'],
+                 ['Running Shoes', 'Jeans', 'Jacket', 'Backpack'], (500, 20000)),
+    'Books': (10, ['Penguin', 'No Starch Press', "O'Reilly", 'HarperCollins'],
+              ['Novel', 'Cookbook', 'Programming Book', 'Atlas'], (200, 5000)),
+    'Sports Equipment': (10, ['Manduka', 'Bowflex', 'NordicTrack', 'Decathlon', 'Yonex'],
+                         ['Yoga Mat', 'Dumbbells', 'Treadmill', 'Racket', 'Bicycle'], (500, 250000)),
+}
+
+# Warranty length in months -> relative weight
+SYNTHETIC_WARRANTIES = {0: 5, 6: 10, 12: 40, 24: 25, 36: 10, 60: 7, 120: 3}
+
+# Purchases are spread over this many years, with recent ones more common
+SYNTHETIC_MEAN_AGE_DAYS = 500
+
+
+_CATEGORY_NAMES = list(SYNTHETIC_CATEGORIES)
+_CATEGORY_CUM_WEIGHTS = list(itertools.accumulate(SYNTHETIC_CATEGORIES[c][0] for c in _CATEGORY_NAMES))
+_WARRANTY_MONTHS = list(SYNTHETIC_WARRANTIES)
+_WARRANTY_CUM_WEIGHTS = list(itertools.accumulate(SYNTHETIC_WARRANTIES.values()))
+
+
+def _synthetic_product(rng, product_id, user_id, today, max_age_days):
+    category = rng.choices(_CATEGORY_NAMES, cum_weights=_CATEGORY_CUM_WEIGHTS)[0]
+    _, brands, items, (low, high) = SYNTHETIC_CATEGORIES[category]
+    brand = rng.choice(brands)
+    purchase_date = today - timedelta(days=min(int(rng.expovariate(1 / SYNTHETIC_MEAN_AGE_DAYS)), max_age_days))
+    warranty = rng.choices(_WARRANTY_MONTHS, cum_weights=_WARRANTY_CUM_WEIGHTS)[0]
+    return {
+        'id': product_id,
+        'name': f"{brand} {rng.choice(items)} {product_id}",
+        'brand': brand,
+        'category': category,
+        'purchase_date': purchase_date,
+        'warranty_duration': warranty,
+        # Log-uniform, so cheap items are far more common than expensive ones
+        'price': round(math.exp(rng.uniform(math.log(low), math.log(high))), 2),
+        'expiry_date': expiry_for(purchase_date, warranty),
+        'receipt': f"INV-{purchase_date.year}-{product_id:07d}",
+        'user_id': user_id,
+    }
+
+
+def _render_assets(task):
+    """Draw one product's placeholder image and receipt PDF (runs in a pool process)"""
+    seed, row, image_path, receipt_path, email = task
+    random.seed(seed)
+    create_placeholder_image(row['name'], image_path, row['category'])
+    create_receipt_pdf(receipt_path, {
+        'receipt_number': row['receipt'],
+        'date': row['purchase_date'].strftime('%Y-%m-%d'),
+        'customer': email,
+        'product_name': row['name'],
+        'brand': row['brand'],
+        'category': row['category'],
+        'price': row['price'],
+        'warranty_months': row['warranty_duration'],
+    })
+
+
+def generate_synthetic(users, products_per_user, seed=42, assets=True, processes=None,
+                       batch_size=10000, years=6, upload_folder=os.path.join('static', 'uploads')):
+    """Bulk-insert users x products_per_user synthetic products for load testing.
+
+    The same ``seed`` produces the same rows when run on the same day against the
+    same starting database: dates are relative to today and ids continue from the
+    current maximum. Users are named
+    load<n>@example.com and share the password "password". With ``assets``
+    each product gets a placeholder image and receipt PDF, drawn on a process
+    pool. Returns (users, products, seconds).
+    """
+    start = time.perf_counter()
+    rng = random.Random(seed)
+    today = date.today()
+    max_age_days = years * 365
+    # Hashing once instead of per user keeps 10k users from costing minutes
+    password_hash = generate_password_hash('password')
+    first_user = (db.session.scalar(select(func.max(User.id))) or 0) + 1
+    next_product = (db.session.scalar(select(func.max(Product.id))) or 0) + 1
+    user_rows = [{'id': first_user + n, 'email': f"load{first_user + n}@example.com",
+                  'password_hash': password_hash, 'created_at': datetime.utcnow()} for n in range(users)]
+    for i in range(0, len(user_rows), batch_size):
+        db.session.execute(User.__table__.insert(), user_rows[i:i + batch_size])
+    db.session.commit()
+
+    pool = ProcessPoolExecutor(processes) if assets else None
+    batch = []
+    total = 0
+    try:
+        for user in user_rows:
+            for _ in range(products_per_user):
+                row = _synthetic_product(rng, next_product, user['id'], today, max_age_days)
+                next_product += 1
+                if assets:
+                    row['product_image'] = f"{user['id']}_{row['id']}.png"
+                    row['receipt_path'] = f"{user['id']}_{row['id']}.pdf"
+                batch.append((row, user['email']))
+                if len(batch) >= batch_size:
+                    total += _flush_synthetic(batch, seed, pool, upload_folder)
+                    batch = []
+        if batch:
+            total += _flush_synthetic(batch, seed, pool, upload_folder)
+    finally:
+        if pool:
+            pool.shutdown()
+        # Batches already committed keep their ids even if a later one failed
+        db.session.rollback()
+        _advance_sequences()
+    # New users have no summary rows yet; they are built on first read
+    return users, total, time.perf_counter() - start
+
+
+def _advance_sequences():
+    """Move PostgreSQL's id sequences past the explicit ids inserted above"""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for table in (User.__table__, Product.__table__):
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('\"{table.name}\"', 'id'), "
+            f"(SELECT COALESCE(MAX(id), 0) + 1 FROM \"{table.name}\"), false)"))
+    db.session.commit()
+
+
+def _flush_synthetic(batch, seed, pool, upload_folder):
+    ids = category_ids((row['user_id'], row['category']) for row, _ in batch)
+    for row, _ in batch:
+        row['category_id'] = ids[(row['user_id'], row['category'])]
+    db.session.execute(Product.__table__.insert(), [row for row, _ in batch])
+    db.session.commit()
+    if pool:
+        # Seeded per product, so the drawings do not depend on pool scheduling
+        tasks = [(f"{seed}-{row['id']}", row, os.path.join(upload_folder, row['product_image']),
+                  os.path.join(upload_folder, row['receipt_path']), email) for row, email in batch]
+        for _ in pool.map(_render_assets, tasks, chunksize=64):
+            pass
+    return len(batch)
@@ -0,0 +1,264 @@
+from datetime import datetime, date, timedelta
+from sqlalchemy import event, func, case, select, update, inspect
+from sqlalchemy.exc import IntegrityError
+from models import db, User, Product, UserStats
+from replicas import use_primary
+
+# Number of days ahead of today that counts as "expiring soon"
+EXPIRING_SOON_DAYS = 30
+
+# Maximum number of products shown in each dashboard list
+DASHBOARD_LIST_LIMIT = 10
+
+
+def _aggregate_query(user_id, today):
+    soon = today + timedelta(days=EXPIRING_SOON_DAYS)
+    return select(
+        func.count(Product.id),
+        func.sum(case((Product.expiry_date >= today, 1), else_=0)),
+        func.sum(case((Product.expiry_date < today, 1), else_=0)),
+        func.sum(case(((Product.expiry_date >= today) & (Product.expiry_date <= soon), 1), else_=0)),
+        func.sum(Product.price),
+        func.max(Product.price),
+        # Zero-month warranties are left out of the average, as before
+        func.sum(case((Product.warranty_duration != 0, Product.warranty_duration), else_=0)),
+        func.sum(case((Product.warranty_duration != 0, 1), else_=0)),
+    ).where(Product.user_id == user_id)
+
+
+def _aggregate(user_id, today):
+    """Run the aggregate query and return the raw summary columns"""
+    row = db.session.execute(_aggregate_query(user_id, today)).one()
+    return {
+        'product_count': row[0] or 0,
+        'active_count': int(row[1] or 0),
+        'expired_count': int(row[2] or 0),
+        'expiring_soon_count': int(row[3] or 0),
+        'total_value': float(row[4] or 0),
+        'max_value': float(row[5] or 0),
+        'duration_sum': int(row[6] or 0),
+        'duration_count': int(row[7] or 0),
+    }
+
+
+def _to_dashboard(summary):
+    return {
+        'total_products': summary['product_count'],
+        'active_products': summary['active_count'],
+        'expired_products': summary['expired_count'],
+        'expiring_soon': summary['expiring_soon_count'],
+        'total_value': summary['total_value'],
+        'max_value': summary['max_value'],
+        'avg_warranty_duration': summary['duration_sum'] / summary['duration_count'] if summary['duration_count'] else 0,
+    }
+
+
+def dashboard_stats(user_id, today=None):
+    """Return the dashboard counters for a user computed in a single aggregate query"""
+    return _to_dashboard(_aggregate(user_id, today or datetime.today().date()))
+
+
+def upcoming_products(user_id, today=None, limit=DASHBOARD_LIST_LIMIT):
+    """Products expiring within the next EXPIRING_SOON_DAYS days, soonest first"""
+    today = today or datetime.today().date()
+    soon = today + timedelta(days=EXPIRING_SOON_DAYS)
+    return Product.query.filter(
+        Product.user_id == user_id,
+        Product.expiry_date >= today,
+        Product.expiry_date <= soon,
+    ).order_by(Product.expiry_date.asc(), Product.id.asc()).limit(limit).all()
+
+
+def expired_products(user_id, today=None, limit=DASHBOARD_LIST_LIMIT):
+    """Products whose warranty has already expired, most recently expired first"""
+    today = today or datetime.today().date()
+    return Product.query.filter(
+        Product.user_id == user_id,
+        Product.expiry_date < today,
+    ).order_by(Product.expiry_date.desc(), Product.id.desc()).limit(limit).all()
+
+
+# --- Incrementally maintained summary (UserStats) ---
+
+BUCKET_FIELDS = ('active_count', 'expired_count', 'expiring_soon_count')
+SUMMARY_FIELDS = ('product_count', 'total_value', 'max_value', 'duration_sum', 'duration_count') + BUCKET_FIELDS
+
+
+def rebuild_user_stats(user_id, today=None):
+    """Recompute a user's summary row from the products table"""
+    today = today or datetime.today().date()
+    # A lagging replica would otherwise have its counts saved on the primary
+    use_primary(db.session)
+    summary = _aggregate(user_id, today)
+    stats = db.session.get(UserStats, user_id)
+    if stats is None:
+        stats = UserStats(user_id=user_id)
+        db.session.add(stats)
+    for field in SUMMARY_FIELDS:
+        setattr(stats, field, summary[field])
+    stats.buckets_date = today
+    return stats
+
+
+def user_stats(user_id, today=None):
+    """Return dashboard counters from the summary table, rolling it over when stale"""
+    today = today or datetime.today().date()
+    stats = db.session.get(UserStats, user_id)
+    if stats is None or stats.buckets_date != today or stats.max_value is None:
+        rebuild_user_stats(user_id, today)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another worker created the row first; theirs is just as fresh
+            db.session.rollback()
+        stats = db.session.get(UserStats, user_id)
+    return _to_dashboard({field: getattr(stats, field) for field in SUMMARY_FIELDS})
+
+
+def rebuild_all_stats(stale_only=False, today=None):
+    """Rebuild summaries for every user (or only those not rolled over to today)"""
+    today = today or datetime.today().date()
+    user_ids = [row[0] for row in db.session.query(User.id)]
+    if stale_only:
+        fresh = {row[0] for row in db.session.query(UserStats.user_id).filter(
+            UserStats.buckets_date == today, UserStats.max_value.isnot(None))}
+        user_ids = [uid for uid in user_ids if uid not in fresh]
+    for user_id in user_ids:
+        rebuild_user_stats(user_id, today)
+    db.session.commit()
+    return len(user_ids)
+
+
+def check_stats(today=None):
+    """Compare stored summaries against the products table.
+
+    Returns a list of (user_id, field, stored, actual) for every mismatch.
+    Date buckets are only checked for rows already rolled over to today.
+    """
+    today = today or datetime.today().date()
+    problems = []
+    for stats in UserStats.query.order_by(UserStats.user_id):
+        actual = _aggregate(stats.user_id, today)
+        for field in SUMMARY_FIELDS:
+            if field in BUCKET_FIELDS and stats.buckets_date != today:
+                continue
+            if field == 'max_value' and stats.max_value is None:
+                continue
+            stored = getattr(stats, field)
+            if abs((stored or 0) - actual[field]) > 0.005:
+                problems.append((stats.user_id, field, stored, actual[field]))
+    return problems
+
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _contribution(user_id, price, duration, expiry, today):
+    """Summary columns contributed by a single product"""
+    expiry = _as_date(expiry)
+    soon = today + timedelta(days=EXPIRING_SOON_DAYS)
+    return user_id, {
+        'product_count': 1,
+        'total_value': price or 0,
+        'duration_sum': duration or 0,
+        'duration_count': 1 if duration else 0,
+        'active_count': 1 if expiry >= today else 0,
+        'expired_count': 1 if expiry < today else 0,
+        'expiring_soon_count': 1 if today <= expiry <= soon else 0,
+    }
+
+
+def _old_value(state, attr):
+    history = state.attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return history.unchanged[0] if history.unchanged else getattr(state.object, attr)
+
+
+def _add_delta(deltas, contribution, sign, price):
+    user_id, values = contribution
+    delta = deltas.setdefault(user_id, {'added_max': None, 'removed_max': None})
+    for field, value in values.items():
+        delta[field] = delta.get(field, 0) + sign * value
+    key = 'added_max' if sign > 0 else 'removed_max'
+    if price is not None and (delta[key] is None or price > delta[key]):
+        delta[key] = price
+
+
+def _apply_deltas(connection, deltas, today):
+    """Apply per-user deltas with atomic UPDATEs on the given connection"""
+    table = UserStats.__table__
+    for user_id, delta in deltas.items():
+        values = {
+            'product_count': table.c.product_count + delta.get('product_count', 0),
+            'total_value': table.c.total_value + delta.get('total_value', 0),
+            'duration_sum': table.c.duration_sum + delta.get('duration_sum', 0),
+            'duration_count': table.c.duration_count + delta.get('duration_count', 0),
+            'updated_at': datetime.utcnow(),
+        }
+        # Buckets computed for another day are recomputed on the next read anyway
+        for field in BUCKET_FIELDS:
+            values[field] = case((table.c.buckets_date == today, table.c[field] + delta.get(field, 0)),
+                                 else_=table.c[field])
+        # Removing the current maximum invalidates it; a larger new price replaces it
+        max_value = table.c.max_value
+        if delta['removed_max'] is not None:
+            max_value = case((table.c.max_value <= delta['removed_max'], None), else_=max_value)
+        if delta['added_max'] is not None:
+            max_value = case((table.c.max_value < delta['added_max'], delta['added_max']), else_=max_value)
+        values['max_value'] = max_value
+        # Users without a row yet get one built from scratch on their next read
+        connection.execute(update(table).where(table.c.user_id == user_id).values(**values))
+
+
+def record_bulk_insert(rows):
+    """Update summaries for product rows inserted in bulk, bypassing the ORM unit of work.
+
+    Call in the same transaction as the insert.
+    """
+    today = date.today()
+    deltas = {}
+    for row in rows:
+        _add_delta(deltas, _contribution(row['user_id'], row['price'], row['warranty_duration'],
+                                         row['expiry_date'], today), 1, row['price'])
+    _apply_deltas(db.session.connection(), deltas, today)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_product_changes(session, flush_context, instances):
+    """Record per-user summary deltas while old attribute values are still available"""
+    today = date.today()
+    deltas = session.info.setdefault('user_stats_deltas', {})
+
+    for obj in session.new:
+        if isinstance(obj, Product):
+            _add_delta(deltas, _contribution(obj.user_id, obj.price, obj.warranty_duration, obj.expiry_date, today),
+                       1, obj.price)
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            _add_delta(deltas, _contribution(obj.user_id, obj.price, obj.warranty_duration, obj.expiry_date, today),
+                       -1, obj.price)
+    for obj in session.dirty:
+        if not isinstance(obj, Product) or not session.is_modified(obj):
+            continue
+        state = inspect(obj)
+        old = [_old_value(state, attr) for attr in ('user_id', 'price', 'warranty_duration', 'expiry_date')]
+        _add_delta(deltas, _contribution(*old, today), -1, old[1])
+        _add_delta(deltas, _contribution(obj.user_id, obj.price, obj.warranty_duration, obj.expiry_date, today),
+                   1, obj.price)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _forget_product_changes(session, previous_transaction):
+    # A failed flush leaves its deltas behind; the next flush must not apply them
+    if not previous_transaction.nested:
+        session.info.pop('user_stats_deltas', None)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _apply_product_changes(session, flush_context):
+    """Apply the recorded deltas inside the flush's transaction"""
+    deltas = session.info.pop('user_stats_deltas', None)
+    if deltas:
+        _apply_deltas(session.connection(), deltas, date.today())
@@ -0,0 +1,232 @@
+import hashlib
+import mimetypes
+import os
+import shutil
+import tempfile
+from flask import Response, send_from_directory
+from sqlalchemy import event, update, delete, insert, exists, select
+from werkzeug.utils import secure_filename
+from models import db, Product, Blob, ProductBlob
+from thumbnails import delete_thumbnails
+from metrics import record_upload
+
+BLOB_DIR = 'blobs'
+CHUNK_SIZE = 64 * 1024
+
+# Product attribute holding the served path for each kind of attachment
+KIND_ATTRIBUTES = {'receipt': 'receipt_path', 'image': 'product_image'}
+
+# Blobs never change under their URL; legacy uploads are revalidated on every use
+BLOB_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def blob_path(sha256, extension):
+    """Content-addressed path of a blob relative to the upload folder"""
+    return f"{BLOB_DIR}/{sha256[:2]}/{sha256}.{extension}" if extension else f"{BLOB_DIR}/{sha256[:2]}/{sha256}"
+
+
+def is_blob(path):
+    return bool(path) and path.startswith(BLOB_DIR + '/')
+
+
+def blob_sha256(path):
+    return os.path.basename(path).split('.', 1)[0]
+
+
+def _extension(filename):
+    filename = secure_filename(filename or '')
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+
+def _write_hashed(upload_folder, stream):
+    """Copy a stream to a temporary file in the blob folder, hashing it on the way"""
+    folder = os.path.join(upload_folder, BLOB_DIR)
+    os.makedirs(folder, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=folder, suffix='.part')
+    with os.fdopen(fd, 'wb') as out:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            out.write(chunk)
+            size += len(chunk)
+    return temp_path, digest.hexdigest(), size
+
+
+def _insert_ignore(values, connection=None):
+    """INSERT a blob row unless one with the same hash already exists"""
+    execute = connection.execute if connection is not None else db.session.execute
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+        stmt = postgresql_insert(Blob).values(**values).on_conflict_do_nothing(index_elements=['sha256'])
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        stmt = sqlite_insert(Blob).values(**values).on_conflict_do_nothing(index_elements=['sha256'])
+    else:
+        if execute(select(Blob.sha256).where(Blob.sha256 == values['sha256'])).first() is not None:
+            return
+        stmt = insert(Blob).values(**values)
+    execute(stmt)
+
+
+def _claim(sha256, path, size):
+    """Take one reference on a blob row, creating it if needed; returns the blob's path"""
+    _insert_ignore({'sha256': sha256, 'path': path, 'size': size, 'ref_count': 0})
+    db.session.execute(update(Blob).where(Blob.sha256 == sha256).values(ref_count=Blob.ref_count + 1))
+    return db.session.get(Blob, sha256, populate_existing=True).path
+
+
+def _release(upload_folder, sha256):
+    """Drop one reference on a blob; its file is unlinked once the transaction commits"""
+    db.session.execute(update(Blob).where(Blob.sha256 == sha256).values(ref_count=Blob.ref_count - 1))
+    blob = db.session.get(Blob, sha256, populate_existing=True)
+    if blob is not None and blob.ref_count <= 0:
+        db.session.execute(delete(Blob).where(Blob.sha256 == sha256, Blob.ref_count <= 0))
+        db.session.info.setdefault('blob_unlinks', []).append((upload_folder, blob.path))
+
+
+def _unlink_unclaimed(upload_folder, sha256, path):
+    """Delete a released blob's file unless the blob has been claimed again since its row went.
+
+    Runs in its own transaction holding the blob's row (a zero-reference placeholder
+    while the file is checked and removed), so a store_upload of the same bytes
+    waits in _claim and then finds no file and writes its own copy.
+    """
+    with db.engine.begin() as connection:
+        _insert_ignore({'sha256': sha256, 'path': path, 'size': 0, 'ref_count': 0}, connection)
+        ref_count = connection.scalar(select(Blob.ref_count).where(Blob.sha256 == sha256).with_for_update())
+        if ref_count:
+            return False
+        full_path = os.path.join(upload_folder, path)
+        if os.path.exists(full_path):
+            os.remove(full_path)
+        delete_thumbnails(upload_folder, path)
+        connection.execute(delete(Blob).where(Blob.sha256 == sha256, Blob.ref_count <= 0))
+    return True
+
+
+def store_upload(upload_folder, file_storage):
+    """Store an uploaded file once under its content hash and take a reference on it.
+
+    Returns the blob's path relative to the upload folder.
+    """
+    temp_path, sha256, size = _write_hashed(upload_folder, file_storage.stream)
+    record_upload(size)
+    path = _claim(sha256, blob_path(sha256, _extension(file_storage.filename)), size)
+    target = os.path.join(upload_folder, path)
+    if os.path.exists(target):
+        os.remove(temp_path)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(temp_path, target)
+    return path
+
+
+def attach(upload_folder, product, kind, path):
+    """Point a product's receipt or image at a stored blob, releasing what it replaces.
+
+    ``path`` must come from store_upload, which already took the new reference.
+    """
+    sha256 = blob_sha256(path)
+    link = db.session.get(ProductBlob, (product.id, kind))
+    if link is None:
+        db.session.add(ProductBlob(product_id=product.id, kind=kind, blob_sha256=sha256))
+    else:
+        previous = link.blob_sha256
+        link.blob_sha256 = sha256
+        db.session.flush()
+        _release(upload_folder, previous)
+    setattr(product, KIND_ATTRIBUTES[kind], path)
+
+
+def detach_all(upload_folder, product):
+    """Release every blob a product references (call before deleting it)"""
+    links = ProductBlob.query.filter_by(product_id=product.id).all()
+    for link in links:
+        db.session.delete(link)
+    db.session.flush()
+    for link in links:
+        _release(upload_folder, link.blob_sha256)
+
+
+def save_product_file(upload_folder, product, kind, file_storage):
+    """Store an upload and attach it to a product that already has an id"""
+    attach(upload_folder, product, kind, store_upload(upload_folder, file_storage))
+
+
+def migrate_file(upload_folder, product, kind):
+    """Move a product's legacy per-user upload into blob storage; returns True if moved"""
+    old_path = getattr(product, KIND_ATTRIBUTES[kind])
+    source = os.path.join(upload_folder, old_path or '')
+    if not old_path or is_blob(old_path) or not os.path.isfile(source):
+        return False
+    with open(source, 'rb') as stream:
+        temp_path, sha256, size = _write_hashed(upload_folder, stream)
+    path = _claim(sha256, blob_path(sha256, _extension(old_path)), size)
+    target = os.path.join(upload_folder, path)
+    if os.path.exists(target):
+        os.remove(temp_path)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(temp_path, target)
+    attach(upload_folder, product, kind, path)
+    return True
+
+
+def user_owns_file(user_id, path):
+    """Whether any of the user's products references an uploaded file.
+
+    Each branch is a single index lookup: product_blob by hash for blobs, and
+    (user_id, receipt_path) / (user_id, product_image) for legacy uploads.
+    """
+    if is_blob(path):
+        condition = exists().where(
+            ProductBlob.blob_sha256 == blob_sha256(path),
+            ProductBlob.product_id == Product.id,
+            Product.user_id == user_id,
+        )
+    else:
+        # Two EXISTS rather than one OR, so neither column falls back to a scan
+        condition = (
+            exists().where(Product.user_id == user_id, Product.receipt_path == path)
+            | exists().where(Product.user_id == user_id, Product.product_image == path)
+        )
+    return db.session.scalar(select(condition))
+
+
+def send_upload(upload_folder, path, accel_redirect=None):
+    """Response for an already-authorised download.
+
+    Blobs get their hash as a strong ETag and a year of private, immutable
+    caching; legacy files get Werkzeug's mtime/size ETag and are revalidated.
+    If-None-Match/If-Modified-Since and Range are answered by send_file. With
+    ``accel_redirect`` set, nginx streams the bytes from that internal location.
+    """
+    if accel_redirect:
+        response = Response(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = accel_redirect.rstrip('/') + '/' + path
+    elif is_blob(path):
+        response = send_from_directory(upload_folder, path, etag=blob_sha256(path), max_age=BLOB_MAX_AGE)
+        response.cache_control.immutable = True
+    else:
+        response = send_from_directory(upload_folder, path)
+    # Downloads are only for their owner, so shared caches must not keep them
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
+
+@event.listens_for(db.session, 'after_commit')
+def _unlink_released_blobs(session):
+    for upload_folder, path in session.info.pop('blob_unlinks', []):
+        _unlink_unclaimed(upload_folder, blob_sha256(path), path)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _forget_released_blobs(session, previous_transaction):
+    if not previous_transaction.nested:
+        session.info.pop('blob_unlinks', None)
@@ -0,0 +1,8 @@
+// Used by `flask build-assets`; only classes found in the templates end up in the CSS
+module.exports = {
+  content: ['./templates/**/*.html'],
+  theme: {
+    extend: {},
+  },
+  plugins: [],
+}
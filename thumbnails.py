@@ -0,0 +1,113 @@
+import os
+from jobs import handler
+
+# Widths generated for every uploaded product image
+THUMBNAIL_WIDTHS = (320, 640)
+THUMBNAIL_DIR = 'thumbs'
+
+# Every thumbnail format that may exist on disk, best first
+THUMBNAIL_MIMETYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+
+_save_options = None
+
+# File extensions that are images rather than receipts
+IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'webp', 'avif'}
+
+
+def is_image(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in IMAGE_EXTENSIONS
+
+
+def _thumbnail_formats():
+    """Output format -> Pillow save options. AVIF is used when this Pillow build can write it.
+
+    Pillow is imported here so that only processes that resize images pay for it.
+    """
+    global _save_options
+    if _save_options is None:
+        from PIL import Image
+        Image.init()
+        options = {'webp': {'format': 'WEBP', 'quality': 80, 'method': 6}}
+        if 'AVIF' in Image.SAVE:
+            options['avif'] = {'format': 'AVIF', 'quality': 60}
+        _save_options = options
+    return _save_options
+
+
+def thumbnail_name(filename, width, fmt='webp'):
+    """Path of a thumbnail relative to the upload folder"""
+    return f"{THUMBNAIL_DIR}/{filename}.{width}.{fmt}"
+
+
+@handler('generate-thumbnails', refreshes_pages=True)
+def generate_thumbnails(upload_folder, filename, overwrite=True):
+    """Write every thumbnail size and format for an uploaded image; returns the paths written"""
+    source = os.path.join(upload_folder, filename)
+    if not is_image(filename) or not os.path.exists(source):
+        return []
+    from PIL import Image, ImageOps, UnidentifiedImageError
+    os.makedirs(os.path.dirname(os.path.join(upload_folder, thumbnail_name(filename, 0))), exist_ok=True)
+    written = []
+    try:
+        original = Image.open(source)
+    except (UnidentifiedImageError, OSError):
+        # Formats this Pillow build cannot decode keep being served as uploaded
+        return []
+    with original:
+        # Phone photos carry their rotation in EXIF; bake it in before resizing
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        for width in THUMBNAIL_WIDTHS:
+            resized = image
+            if image.width > width:
+                resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+            for fmt, options in _thumbnail_formats().items():
+                target = os.path.join(upload_folder, thumbnail_name(filename, width, fmt))
+                if overwrite or not os.path.exists(target):
+                    resized.save(target, **options)
+                    written.append(target)
+    return written
+
+
+def delete_thumbnails(upload_folder, filename):
+    for width in THUMBNAIL_WIDTHS:
+        for fmt in THUMBNAIL_MIMETYPES:
+            path = os.path.join(upload_folder, thumbnail_name(filename, width, fmt))
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def responsive_image(upload_folder, filename):
+    """Template data for an <img>/<picture>: fallback src plus a srcset per available format.
+
+    Falls back to the original upload until its thumbnails have been generated.
+    """
+    original = f"/static/uploads/{filename}"
+    sources = {}
+    for fmt in THUMBNAIL_MIMETYPES:
+        available = [(width, thumbnail_name(filename, width, fmt)) for width in THUMBNAIL_WIDTHS
+                     if os.path.exists(os.path.join(upload_folder, thumbnail_name(filename, width, fmt)))]
+        if available:
+            sources[fmt] = ', '.join(f"/static/uploads/{name} {width}w" for width, name in available)
+    if 'webp' not in sources:
+        return {'src': original, 'sources': {}, 'srcset': None}
+    smallest = f"/static/uploads/{thumbnail_name(filename, THUMBNAIL_WIDTHS[0])}"
+    return {
+        'src': smallest,
+        'srcset': sources['webp'],
+        # Formats better than WebP go into <source> elements, best first
+        'sources': {THUMBNAIL_MIMETYPES[fmt]: srcset for fmt, srcset in sources.items() if fmt != 'webp'},
+    }
+
+
+def thumbnail_savings(upload_folder, filenames, width):
+    """Return (original bytes, thumbnail bytes) for the given uploads at one width"""
+    original_bytes = thumb_bytes = 0
+    for filename in filenames:
+        source = os.path.join(upload_folder, filename)
+        thumb = os.path.join(upload_folder, thumbnail_name(filename, width))
+        if os.path.exists(source) and os.path.exists(thumb):
+            original_bytes += os.path.getsize(source)
+            thumb_bytes += os.path.getsize(thumb)
+    return original_bytes, thumb_bytes
@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from flask import current_app
+from sqlalchemy import event, inspect
+from models import db, User
+
+# Entries beyond this are dropped wholesale rather than tracked for LRU eviction
+MAX_CACHED_USERS = 10000
+
+_cache = {}  # user id -> (expires at, detached User copy)
+_lock = threading.Lock()
+
+
+def _snapshot(user):
+    """A transient copy that stays readable after the request's session is closed"""
+    return User(id=user.id, email=user.email, password_hash=user.password_hash, created_at=user.created_at)
+
+
+def cached_user(user_id, primary=False):
+    """Return a read-only copy of a user, loading it at most once per USER_CACHE_TTL seconds.
+
+    The copy may be stale; load_session_user checks it against the user's session stamp.
+
+    Routes that change the user must load it from the session instead and then
+    call invalidate_user.
+    """
+    ttl = current_app.config.get('USER_CACHE_TTL', 60)
+    now = time.monotonic()
+    entry = _cache.get(user_id)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+    user = db.session.get(User, user_id, bind_arguments={'bind': db.engine} if primary else None)
+    if user is None:
+        invalidate_user(user_id)
+        return None
+    user = _snapshot(user)
+    if ttl > 0:
+        with _lock:
+            if len(_cache) >= MAX_CACHED_USERS:
+                _cache.clear()
+            _cache[user_id] = (now + ttl, user)
+    return user
+
+
+def invalidate_user(user_id):
+    with _lock:
+        _cache.pop(user_id, None)
+
+
+def _stamp_path(user_id):
+    return os.path.join(current_app.config['SESSION_STAMP_DIR'], str(user_id))
+
+
+def stamped_version(user_id):
+    """The session version last recorded for a user by any process, or None"""
+    try:
+        with open(_stamp_path(user_id)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def stamp_session_version(user_id, version):
+    """Record a user's session version where every worker process checks it"""
+    path = _stamp_path(user_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp_path, 'w') as f:
+        f.write(version)
+    os.replace(temp_path, path)
+
+
+def load_session_user(session_id):
+    """Flask-Login user loader for "<id>:<session version>" ids.
+
+    Sessions issued before a password change carry the old version and are
+    rejected on the next request in every process: a password change writes the
+    new version to the user's stamp file, and a cached copy with another version
+    is reloaded from the primary. Otherwise no query is run.
+    """
+    user_id, _, version = session_id.partition(':')
+    if not user_id.isdigit():
+        return None
+    user_id = int(user_id)
+    user = cached_user(user_id)
+    stamped = stamped_version(user_id)
+    if user is not None and stamped is not None and stamped != user.session_version:
+        invalidate_user(user_id)
+        user = cached_user(user_id, primary=True)
+        if user is not None and user.session_version != stamped:
+            # Left over from a database the ids were reused from; the primary is authoritative
+            stamp_session_version(user_id, user.session_version)
+    if user is None or user.session_version != version:
+        return None
+    return user
+
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_password_changes(session, flush_context, instances):
+    changed = session.info.setdefault('password_changes', {})
+    for obj in session.dirty:
+        if isinstance(obj, User) and inspect(obj).attrs.password_hash.history.has_changes():
+            changed[obj.id] = obj.session_version
+
+
+@event.listens_for(db.session, 'after_commit')
+def _stamp_password_changes(session):
+    for user_id, version in session.info.pop('password_changes', {}).items():
+        stamp_session_version(user_id, version)
+        invalidate_user(user_id)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _forget_password_changes(session, previous_transaction):
+    if not previous_transaction.nested:
+        session.info.pop('password_changes', None)
@@ -0,0 +1,17 @@
+"""
+Background job worker for thumbnails, seed files and other queued jobs
+Run this with: python worker.py [--threads 2] [--once]
+Web processes leave every job to this worker unless JOBS_EXECUTOR=thread.
+"""
+
+import argparse
+from app import create_app
+from jobs import run_worker
+
+if __name__ == '__main__':
+    app = create_app()
+    parser = argparse.ArgumentParser(description='Run queued background jobs')
+    parser.add_argument('--threads', type=int, default=app.config['JOBS_THREADS'])
+    parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+    args = parser.parse_args()
+    run_worker(app, threads=args.threads, once=args.once)
@@ -1,13 +1,13 @@
 """
 WSGI entry point for production deployment
 This file is used by production servers like Gunicorn
+
+Workers do no database work on start; run `flask --app app init-db` once per deploy.
 """
 
-from app import app, init_db
+from app import create_app
 
-# Initialize database when the WSGI app starts
-if __name__ != '__main__':
-    init_db()
+app = create_app()
 
 if __name__ == '__main__':
     app.run()